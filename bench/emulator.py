@@ -0,0 +1,401 @@
+import hashlib
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+HEADER = ["address", "city", "state", "zip_code", "image_URL", "Processing Status"]
+
+# Per-endpoint behaviour: lognormal latency (median, sigma), quota and failure rate.
+# qps=0 disables the quota for that endpoint.
+DEFAULT_PROFILE = {
+    "geocode": {"median_ms": 80, "sigma": 0.4, "qps": 50, "burst": 10, "error_rate": 0.0},
+    "metadata": {"median_ms": 60, "sigma": 0.4, "qps": 50, "burst": 10, "error_rate": 0.0},
+    "static": {"median_ms": 150, "sigma": 0.5, "qps": 50, "burst": 10, "error_rate": 0.0},
+    "cloudinary": {"median_ms": 450, "sigma": 0.5, "qps": 20, "burst": 5, "error_rate": 0.0},
+    "sheets_read": {"median_ms": 250, "sigma": 0.3, "qps": 1, "burst": 5, "error_rate": 0.0},
+    "sheets_write": {"median_ms": 400, "sigma": 0.3, "qps": 1, "burst": 3, "error_rate": 0.0},
+    # 500 calls per hour, modelled as the burst
+    "cloudinary_admin": {"median_ms": 300, "sigma": 0.3, "qps": 0.14, "burst": 500, "error_rate": 0.0},
+}
+
+IMAGE_BYTES = 40000  # Roughly a 560x430 Street View JPEG
+PANO_GRID = 0.0002  # ~20m: addresses this close share a panorama
+NO_PANO_RATE = 0.03
+
+CITIES = [("Philadelphia", "PA", "191"), ("Camden", "NJ", "081"), ("Wilmington", "DE", "198")]
+STREETS = ["Main", "Market", "Walnut", "Chestnut", "Pine", "Spruce", "Oak", "Cedar", "Elm", "Maple"]
+
+_CELL = re.compile(r"([A-Z]+)(\d*)")
+
+
+def _col_number(letters):
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - 64
+    return number
+
+
+def _parse_range(a1):
+    """'F2:G10' -> (first_row, last_row, first_col, last_col), all 1-based
+
+    last_row is None for an open-ended range such as 'F2:G'.
+    """
+    start, _, end = a1.partition(":")
+    start_col, start_row = _CELL.fullmatch(start).groups()
+    end_col, end_row = _CELL.fullmatch(end or start).groups()
+    return int(start_row), int(end_row) if end_row else None, _col_number(start_col), _col_number(end_col)
+
+
+def _hash_unit(text):
+    """Deterministic float in [0, 1) for a string"""
+    return int(hashlib.md5(text.encode()).hexdigest()[:8], 16) / 0x100000000
+
+
+def make_rows(count, duplicate_rate=0.2, miss_rate=0.02, seed=1):
+    """Generate sheet rows with some repeated and ungeocodable addresses"""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        if rows and rng.random() < duplicate_rate:
+            rows.append(list(rng.choice(rows)))
+            continue
+        city, state, zip_prefix = rng.choice(CITIES)
+        street = "Nowhere" if rng.random() < miss_rate else rng.choice(STREETS)
+        address = f"{rng.randint(1, 4000)} {street} St"
+        rows.append([address, city, state, f"{zip_prefix}{rng.randint(0, 99):02d}", "", ""])
+    return rows
+
+
+class _Bucket:
+    def __init__(self, qps, burst):
+        self.qps = qps
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def allow(self):
+        if self.qps <= 0:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.qps)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class Emulator:
+    """In-process stand-in for the Google Maps, Sheets and Cloudinary endpoints
+
+    Serves one generated sheet and records per-endpoint call counts, quota
+    rejections and injected failures. Per-row latency runs from the first
+    geocode request for a row's address to the sheet write that fills it.
+    """
+
+    def __init__(self, rows, profile=None, latency_scale=1.0, seed=1, assets=None):
+        self.profile = {name: dict(settings) for name, settings in DEFAULT_PROFILE.items()}
+        for name, settings in (profile or {}).items():
+            self.profile[name].update(settings)
+        self.latency_scale = latency_scale
+        self.rows = rows
+        self.lock = threading.Lock()
+        self.rng = random.Random(seed)
+        self.buckets = {
+            name: _Bucket(settings["qps"], settings["burst"]) for name, settings in self.profile.items()
+        }
+        self.calls = {name: 0 for name in self.profile}
+        self.rejected = {name: 0 for name in self.profile}
+        self.failed = {name: 0 for name in self.profile}
+        self.bytes_sent = 0
+        self.address_started = {}
+        self.row_written = {}
+        self.assets = dict(assets or {})  # public_id -> secure_url of hosted images
+        self.tags = {}  # public_id -> set of tags
+        self.server = None
+        self.url = None
+
+    # --- Server lifecycle ---
+
+    def start(self, host="127.0.0.1", port=0):
+        emulator = self
+
+        class Handler(_Handler):
+            pass
+
+        Handler.emulator = emulator
+        self.server = _Server((host, port), Handler)
+        self.server.daemon_threads = True
+        self.server.request_queue_size = 1024
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, name="emulator", daemon=True).start()
+        return self.url
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    # --- Behaviour shared by every endpoint ---
+
+    def admit(self, endpoint):
+        """Count the call, sleep its latency and decide quota/failure outcome"""
+        settings = self.profile[endpoint]
+        with self.lock:
+            self.calls[endpoint] += 1
+            latency = settings["median_ms"] / 1000 * math.exp(settings["sigma"] * self.rng.gauss(0, 1))
+            fail = self.rng.random() < settings["error_rate"]
+        # Quota is charged on arrival, like the real APIs
+        allowed = self.buckets[endpoint].allow()
+        time.sleep(latency * self.latency_scale)
+        if not allowed:
+            with self.lock:
+                self.rejected[endpoint] += 1
+            return "quota"
+        if fail:
+            with self.lock:
+                self.failed[endpoint] += 1
+            return "error"
+        return "ok"
+
+    def geocode(self, address):
+        with self.lock:
+            self.address_started.setdefault(address, time.time())
+        if "Nowhere" in address:
+            return None
+        lat = 39.90 + _hash_unit("lat" + address) * 0.1
+        lng = -75.20 + _hash_unit("lng" + address) * 0.1
+        return lat, lng
+
+    def metadata(self, lat, lng):
+        cell = (round(lat / PANO_GRID), round(lng / PANO_GRID))
+        pano_id = f"pano_{cell[0]}_{cell[1]}"
+        if _hash_unit(pano_id) < NO_PANO_RATE:
+            return None
+        return cell[0] * PANO_GRID, cell[1] * PANO_GRID, pano_id
+
+    def read_ranges(self, ranges):
+        value_ranges = []
+        for a1 in ranges:
+            first_row, last_row, first_col, last_col = _parse_range(a1)
+            values = []
+            with self.lock:
+                if last_row is None:
+                    last_row = len(self.rows) + 1
+                for row_number in range(first_row, last_row + 1):
+                    if row_number == 1:
+                        values.append(HEADER[first_col - 1:last_col])
+                    elif row_number - 2 < len(self.rows):
+                        values.append(self.rows[row_number - 2][first_col - 1:last_col])
+            # Like the Sheets API, trailing empty rows are omitted
+            while values and not any(values[-1]):
+                values.pop()
+            value_ranges.append([row if any(row) else [] for row in values])
+        return value_ranges
+
+    def write_ranges(self, data):
+        now = time.time()
+        with self.lock:
+            for update in data:
+                first_row, _, first_col, _ = _parse_range(update["range"])
+                for offset, values in enumerate(update["values"]):
+                    row_number = first_row + offset
+                    if row_number < 2 or row_number - 2 >= len(self.rows):
+                        continue
+                    row = self.rows[row_number - 2]
+                    for col_offset, value in enumerate(values):
+                        row[first_col - 1 + col_offset] = value
+                    # Lease markers (utils/leases.py) are not results
+                    if not all(str(value).startswith("Leased by ") for value in values):
+                        self.row_written.setdefault(row_number - 2, now)
+
+    def host_asset(self, public_id):
+        # Same shape as Cloudinary delivery URLs, so variant URLs can be derived from it
+        secure_url = f"{self.url}/res/image/upload/v1/{public_id}.jpg"
+        with self.lock:
+            self.assets[public_id] = secure_url
+        return secure_url
+
+    def list_assets(self, prefix="", max_results=500, cursor=None):
+        """One page of hosted assets in public_id order, and the next cursor"""
+        with self.lock:
+            ids = sorted(public_id for public_id in self.assets if public_id.startswith(prefix))
+            start = ids.index(cursor) if cursor in ids else 0
+            page = ids[start:start + max_results]
+            resources = [{"public_id": public_id, "secure_url": self.assets[public_id],
+                          "tags": sorted(self.tags.get(public_id, ()))} for public_id in page]
+        next_cursor = ids[start + max_results] if start + max_results < len(ids) else None
+        return resources, next_cursor
+
+    # --- Reporting ---
+
+    def row_latencies(self, run_start):
+        latencies = []
+        with self.lock:
+            for index, written in self.row_written.items():
+                row = self.rows[index]
+                address = f"{row[0]}, {row[1]}, {row[2]} {row[3]}"
+                started = self.address_started.get(address, run_start)
+                latencies.append(max(0.0, written - started))
+        return latencies
+
+    def stats(self):
+        with self.lock:
+            return {
+                "calls": dict(self.calls),
+                "rejected": dict(self.rejected),
+                "failed": dict(self.failed),
+                "bytes_sent": self.bytes_sent,
+                "rows_written": len(self.row_written),
+            }
+
+
+class _Server(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # Clients that disconnect mid-request (an interrupted benchmark run) are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real APIs
+    emulator = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json"):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with self.emulator.lock:
+            self.emulator.bytes_sent += len(body)
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _form_fields(self, body):
+        """Text fields of a urlencoded or multipart upload form"""
+        if self.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+            return {key: values[0] for key, values in parse_qs(body.decode()).items()}
+        fields = {}
+        for name, value in re.findall(rb'name="([^"]+)"\r\n(?:[^\r\n]+\r\n)*\r\n([^\r]*)\r\n--', body):
+            fields[name.decode()] = value.decode(errors="replace")
+        return fields
+
+    def do_GET(self):
+        emulator = self.emulator
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        if url.path == "/maps/api/geocode/json":
+            outcome = emulator.admit("geocode")
+            if outcome == "quota":
+                return self._send(200, {"status": "OVER_QUERY_LIMIT", "results": []})
+            if outcome == "error":
+                return self._send(500, {"status": "UNKNOWN_ERROR", "results": []})
+            location = emulator.geocode(query.get("address", ""))
+            if location is None:
+                return self._send(200, {"status": "ZERO_RESULTS", "results": []})
+            lat, lng = location
+            return self._send(200, {"status": "OK", "results": [{"geometry": {"location": {"lat": lat, "lng": lng}}}]})
+
+        if url.path == "/maps/api/streetview/metadata":
+            outcome = emulator.admit("metadata")
+            if outcome == "quota":
+                return self._send(200, {"status": "OVER_QUERY_LIMIT"})
+            if outcome == "error":
+                return self._send(500, {"status": "UNKNOWN_ERROR"})
+            lat, lng = (float(part) for part in query.get("location", "0,0").split(","))
+            pano = emulator.metadata(lat, lng)
+            if pano is None:
+                return self._send(200, {"status": "ZERO_RESULTS"})
+            pano_lat, pano_lng, pano_id = pano
+            return self._send(200, {"status": "OK", "pano_id": pano_id, "location": {"lat": pano_lat, "lng": pano_lng}})
+
+        if url.path == "/maps/api/streetview":
+            outcome = emulator.admit("static")
+            if outcome != "ok":
+                return self._send(429 if outcome == "quota" else 500, b"", "text/plain")
+            return self._send(200, b"\xff\xd8" + bytes(IMAGE_BYTES - 2), "image/jpeg")
+
+        if url.path.endswith("/resources/image/upload"):
+            outcome = emulator.admit("cloudinary_admin")
+            if outcome != "ok":
+                return self._send(420 if outcome == "quota" else 500, {"error": {"message": outcome}})
+            resources, next_cursor = emulator.list_assets(
+                query.get("prefix", ""), int(query.get("max_results", 500)), query.get("next_cursor")
+            )
+            page = {"resources": resources}
+            if next_cursor:
+                page["next_cursor"] = next_cursor
+            return self._send(200, page)
+
+        if url.path == "/sheets/header":
+            return self._send(200, {"header": HEADER, "row_count": len(emulator.rows) + 1})
+
+        self._send(404, {"error": {"message": f"Unknown path {url.path}"}})
+
+    def do_POST(self):
+        emulator = self.emulator
+        url = urlparse(self.path)
+        body = self._body()
+
+        if url.path.endswith("/image/upload"):
+            outcome = emulator.admit("cloudinary")
+            if outcome == "quota":
+                return self._send(420, {"error": {"message": "Rate Limit Exceeded"}})
+            if outcome == "error":
+                return self._send(500, {"error": {"message": "Internal Server Error"}})
+            fields = self._form_fields(body)
+            source = fields.get("file", "")
+            if source.startswith(("http://", "https://")):
+                # Server-side fetch: the emulated Cloudinary pulls the image from the Street View endpoint
+                fetched = emulator.admit("static")
+                if fetched != "ok":
+                    status = "429 Too Many Requests" if fetched == "quota" else "500 Internal Server Error"
+                    return self._send(400, {"error": {"message": f"Error in loading {source} - {status}"}})
+            public_id = fields.get("public_id") or hashlib.md5(body).hexdigest()
+            secure_url = emulator.host_asset(public_id)
+            return self._send(200, {"public_id": public_id, "secure_url": secure_url, "bytes": len(body)})
+
+        if url.path.endswith("/image/tags"):
+            outcome = emulator.admit("cloudinary")
+            if outcome != "ok":
+                return self._send(420 if outcome == "quota" else 500, {"error": {"message": outcome}})
+            fields = self._form_fields(body)
+            public_id = fields.get("public_ids[]", "")
+            with emulator.lock:
+                emulator.tags.setdefault(public_id, set()).add(fields.get("tag", ""))
+            return self._send(200, {"public_ids": [public_id]})
+
+        if url.path == "/sheets/values:batchGet":
+            outcome = emulator.admit("sheets_read")
+            if outcome != "ok":
+                return self._send(429 if outcome == "quota" else 500, {"error": {"message": outcome}})
+            ranges = json.loads(body)["ranges"]
+            return self._send(200, {"valueRanges": emulator.read_ranges(ranges)})
+
+        if url.path == "/sheets/values:batchUpdate":
+            outcome = emulator.admit("sheets_write")
+            if outcome != "ok":
+                return self._send(429 if outcome == "quota" else 500, {"error": {"message": outcome}})
+            emulator.write_ranges(json.loads(body)["data"])
+            return self._send(200, {"totalUpdatedRanges": len(json.loads(body)["data"])})
+
+        self._send(404, {"error": {"message": f"Unknown path {url.path}"}})
+
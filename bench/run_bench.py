@@ -0,0 +1,183 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from emulator import DEFAULT_PROFILE, Emulator, make_rows
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# script, extra arguments
+ENTRY_POINTS = {
+    "run_batch:threads": ("run_batch.py", ["--engine", "threads"]),
+    "run_batch:async": ("run_batch.py", ["--engine", "async"]),
+    "run_batch:staged": ("run_batch.py", ["--engine", "staged"]),
+    "run_large_batch:threads": ("run_large_batch.py", ["--engine", "threads"]),
+    "run_large_batch:async": ("run_large_batch.py", ["--engine", "async"]),
+    "run_large_batch:staged": ("run_large_batch.py", ["--engine", "staged"]),
+}
+DEFAULT_SIZES = [1000, 10000, 100000]
+API_ENDPOINTS = ["geocode", "metadata", "static", "cloudinary", "sheets_read", "sheets_write", "cloudinary_admin"]
+CLIENT_HEADROOM = 0.9  # Client QPS as a fraction of the emulated quota, absorbing scheduling jitter
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[rank]
+
+
+def run_case(entry, size, args):
+    """Run one entry point against a fresh emulator and return its measurements"""
+    script, script_args = ENTRY_POINTS[entry]
+    profile = {}
+    for name in DEFAULT_PROFILE:
+        profile[name] = {"error_rate": args.failure_rate}
+        profile[name]["qps"] = DEFAULT_PROFILE[name]["qps"] * args.quota_scale
+    emulator = Emulator(make_rows(size, args.duplicate_rate, seed=args.seed), profile,
+                        latency_scale=args.latency_scale, seed=args.seed)
+    url = emulator.start()
+
+    with tempfile.TemporaryDirectory() as state_dir:
+        env = dict(os.environ)
+        env.update({
+            "GOOGLE_MAPS_BASE_URL": url,
+            "CLOUDINARY_UPLOAD_PREFIX": url,
+            "SHEETS_EMULATOR_URL": url,
+            # Fresh caches and limiter state so every case starts cold
+            "GEOCODE_CACHE_PATH": os.path.join(state_dir, "geocode_cache.sqlite"),
+            "RATE_LIMIT_STATE": os.path.join(state_dir, "ratelimit.state"),
+            "CLOUDINARY_UPLOAD_MODE": args.upload_mode,
+        })
+        # Client-side limits sit just under the emulated quotas, as they would in production
+        for name in ("geocode", "metadata", "static", "cloudinary", "sheets_read", "sheets_write", "cloudinary_admin"):
+            env[f"RATE_LIMIT_{name.upper()}_QPS"] = str(emulator.profile[name]["qps"] * CLIENT_HEADROOM)
+            env[f"RATE_LIMIT_{name.upper()}_BURST"] = str(emulator.profile[name]["burst"])
+
+        start = time.time()
+        try:
+            proc = subprocess.run(
+                [sys.executable, os.path.join(REPO_ROOT, script)] + script_args,
+                # Progress files and caches land in the temp dir, not the repo
+                cwd=state_dir,
+                env=dict(env, PYTHONPATH=REPO_ROOT),
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL if not args.verbose else None,
+                stderr=subprocess.STDOUT if not args.verbose else None,
+                timeout=args.timeout,
+            )
+            returncode = proc.returncode
+        except subprocess.TimeoutExpired:
+            returncode = "timeout"
+        wall = time.time() - start
+
+    stats = emulator.stats()
+    latencies = emulator.row_latencies(start)
+    emulator.stop()
+
+    rows = stats["rows_written"]
+    return {
+        "entry": entry,
+        "rows": size,
+        "rows_written": rows,
+        "returncode": returncode,
+        "wall_seconds": round(wall, 2),
+        "rows_per_sec": round(rows / wall, 2) if wall else 0.0,
+        "p50_latency": round(percentile(latencies, 50), 3),
+        "p99_latency": round(percentile(latencies, 99), 3),
+        "calls_per_row": {
+            name: round(stats["calls"][name] / rows, 3) if rows else 0.0 for name in API_ENDPOINTS
+        },
+        "rejected": stats["rejected"],
+        "failed": stats["failed"],
+    }
+
+
+def print_report(results):
+    print(f"\n{'entry':<26}{'rows':>8}{'rows/s':>10}{'p50 s':>9}{'p99 s':>9}  calls/row")
+    for r in results:
+        calls = " ".join(f"{name}={value}" for name, value in r["calls_per_row"].items() if value)
+        print(f"{r['entry']:<26}{r['rows']:>8}{r['rows_per_sec']:>10}{r['p50_latency']:>9}{r['p99_latency']:>9}  {calls}")
+        if r["returncode"] != 0:
+            print(f"{'':<26}exit: {r['returncode']}, wrote {r['rows_written']}/{r['rows']} rows")
+
+
+def check_regressions(results, args):
+    """Return a list of failure messages for throughput regressions"""
+    failures = []
+    for r in results:
+        if r["returncode"] != 0:
+            failures.append(f"{r['entry']} @ {r['rows']}: exited with {r['returncode']}")
+        if args.min_rows_per_sec and r["rows_per_sec"] < args.min_rows_per_sec:
+            failures.append(f"{r['entry']} @ {r['rows']}: {r['rows_per_sec']} rows/s < {args.min_rows_per_sec}")
+
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = {(b["entry"], b["rows"]): b for b in json.load(f)}
+        for r in results:
+            previous = baseline.get((r["entry"], r["rows"]))
+            if previous and r["rows_per_sec"] < previous["rows_per_sec"] * (1 - args.tolerance):
+                failures.append(
+                    f"{r['entry']} @ {r['rows']}: {r['rows_per_sec']} rows/s, "
+                    f"baseline {previous['rows_per_sec']} (-{args.tolerance:.0%} allowed)"
+                )
+    return failures
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Throughput benchmarks against the local API emulator")
+    parser.add_argument("--entries", default=",".join(ENTRY_POINTS),
+                        help=f"comma-separated entry points ({', '.join(ENTRY_POINTS)})")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="comma-separated row counts")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiply every emulated latency")
+    parser.add_argument("--quota-scale", type=float, default=1.0, help="multiply every emulated quota")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of calls answered with a 500")
+    parser.add_argument("--duplicate-rate", type=float, default=0.2, help="fraction of rows repeating an address")
+    parser.add_argument("--upload-mode", choices=["proxy", "fetch"], default="proxy",
+                        help="proxy: download and re-upload images; fetch: Cloudinary fetches them")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=3600, help="seconds before a case is abandoned")
+    parser.add_argument("--baseline", help="JSON results to compare throughput against")
+    parser.add_argument("--save-baseline", action="store_true", help="write these results to --baseline")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed throughput drop vs baseline")
+    parser.add_argument("--min-rows-per-sec", type=float, help="fail any case below this throughput")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--verbose", action="store_true", help="show entry point output")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    entries = [entry.strip() for entry in args.entries.split(",") if entry.strip()]
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    results = []
+    for size in sizes:
+        for entry in entries:
+            print(f"Running {entry} with {size} rows...")
+            results.append(run_case(entry, size, args))
+    print_report(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline and args.baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    failures = check_regressions(results, args)
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,25 @@
+from utils.offline_geocoder import INDEX_PATH, build_index, read_openaddresses
+
+import argparse
+import itertools
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Build the offline geocoder's address-point index from OpenAddresses CSV files")
+    parser.add_argument("sources", nargs="+", help="OpenAddresses CSV files (LON, LAT, NUMBER, STREET, CITY, "
+                                                   "REGION, POSTCODE columns)")
+    parser.add_argument("--out", default=INDEX_PATH, help=f"index file to write (default {INDEX_PATH})")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    start = time.time()
+    print(f"Indexing {len(args.sources)} address files...")
+    points = itertools.chain.from_iterable(read_openaddresses(path) for path in args.sources)
+    count = build_index(points, args.out)
+    print(f"Wrote {count} address keys to {args.out} in {time.time() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
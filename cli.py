@@ -0,0 +1,56 @@
+import importlib
+import sys
+
+# name: (module, extra arguments, help). Modules are imported only when their
+# command runs, so `cli.py --help` and light commands skip Sheets, Cloudinary and numpy.
+COMMANDS = {
+    "run": ("run_large_batch", [], "process the sheet (or --input file) with adaptive concurrency, "
+                                   "leases and a deadline"),
+    "watch": ("run_large_batch", ["--watch"], "keep running and process rows as they are added to the sheet"),
+    "batch": ("run_batch", [], "process every pending sheet row in one pass"),
+    "plan": ("run_large_batch", ["--plan"], "predict API calls, cost and wall time without calling paid APIs"),
+    "check-sheet": (None, [], "open the sheet and show how many rows are pending, without writing"),
+    "build-index": ("build_address_index", [], "build the offline geocoder index from OpenAddresses CSVs"),
+}
+
+
+def usage():
+    lines = ["usage: cli.py <command> [options]", "", "commands:"]
+    lines += [f"  {name:<12} {help_text}" for name, (_, _, help_text) in COMMANDS.items()]
+    lines += ["", "Run `cli.py <command> --help` for a command's options."]
+    return "\n".join(lines)
+
+
+def check_sheet():
+    """Read-only sheet check: header layout, pending rows and a sample row"""
+    from utils.sheets import get_sheet, get_column_layout, iter_rows_to_process
+
+    sheet = get_sheet()
+    print(f"Columns: {get_column_layout(sheet)}")
+    rows = list(iter_rows_to_process(sheet))
+    print(f"Found {len(rows)} rows to process.")
+    if rows:
+        print(f"Sample row {rows[0][0] + 2}: {rows[0][1]}")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage())
+        return 0
+    if argv[0] not in COMMANDS:
+        print(f"Unknown command: {argv[0]}\n\n{usage()}")
+        return 2
+
+    command, rest = argv[0], argv[1:]
+    module_name, extra, _ = COMMANDS[command]
+    if module_name is None:
+        return check_sheet()
+
+    # Each command's own parser reads sys.argv, as when its script is run directly
+    sys.argv = [f"cli.py {command}"] + extra + rest
+    return importlib.import_module(module_name).main()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,9 @@
-import requests
 import cloudinary.uploader
 import time
 
 # Import helpers
 from utils.sheets import update_row
+from utils.transport import session
 from utils.keys import GOOGLE_API_KEY, CLOUDINARY_CONFIG
 
 # Configure Cloudinary
@@ -20,7 +20,7 @@ def build_address(row):
 
 def get_coords(address):
     url = f"https://maps.googleapis.com/maps/api/geocode/json?address={address}&key={GOOGLE_API_KEY}"
-    res = requests.get(url).json()
+    res = session.get(url).json()
     if res["status"] != "OK":
         return None
     location = res["results"][0]["geometry"]["location"]
@@ -28,14 +28,14 @@ def get_coords(address):
 
 def get_pano_metadata(lat, lng):
     url = f"https://maps.googleapis.com/maps/api/streetview/metadata?location={lat},{lng}&key={GOOGLE_API_KEY}"
-    res = requests.get(url).json()
+    res = session.get(url).json()
     if res["status"] != "OK":
         return None
     return res.get("pano_id")
 
 def download_street_view(pano_id, heading=0):
     url = f"https://maps.googleapis.com/maps/api/streetview?size=560x430&pano={pano_id}&heading={heading}&pitch=10&fov=70&key={GOOGLE_API_KEY}"
-    res = requests.get(url)
+    res = session.get(url)
     if res.status_code != 200:
         return None
     return res.content
@@ -1,9 +1,7 @@
-from utils.sheets import read_sheet
+import sys
 
-def main():
-    print("Running Street View Tool...")
-    data = read_sheet()
-    print(f"Read {len(data)} rows from sheet.")
+from cli import main
 
+# Same as cli.py: `python main.py run`, `python main.py plan`, ...
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
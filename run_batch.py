@@ -1,95 +1,113 @@
-from utils.sheets import get_sheet, get_rows_to_process, batch_update_rows
-from utils.gmaps import get_metadata, get_geocode, calculate_heading
-from utils.cloud import upload_to_cloudinary
-from utils.keys import GOOGLE_API_KEY
+from utils.sheets import get_sheet, get_rows_to_process, iter_rows_to_process, SheetSink
+from utils.pipeline import build_address, process_address, load_existing_assets, order_rows_spatially
+from utils.writer import SheetWriter
+from utils.metrics import metrics
+from utils.tracing import tracer
+from utils.planner import plan_rows, format_plan
 
+import argparse
 import concurrent.futures
 import threading
-import time
 
 # Thread-safe list to collect updates
 update_results = []
 update_lock = threading.Lock()
+writer = None  # Background SheetWriter for the current run
 
 def process_row(index, row):
-    try:
-        full_address = f"{row['address']}, {row['city']}, {row['state']} {row['zip_code']}"
-        print(f"Processing: {full_address}")
+    with tracer.span("row", cat="row", row=index):
+        try:
+            print(f"Processing: {build_address(row)}")
 
-        # Get coordinates
-        target_lat, target_lng = get_geocode(full_address)
-        pano_lat, pano_lng, pano_id = get_metadata(target_lat, target_lng)
+            # Geocode, look up the panorama and upload (deduplicated per pano)
+            hosted_url = process_address(row)
 
-        if not pano_id or None in [pano_lat, pano_lng, target_lat, target_lng]:
-            raise ValueError("Missing required location data.")
+            result = (index, hosted_url, "Success")
+        except Exception as e:
+            result = (index, "", f"Error: {str(e)}")
+            print(f"Error on row {index + 1}: {e}")
+    record_result(result)
 
-        heading = calculate_heading(pano_lat, pano_lng, target_lat, target_lng)
+def record_result(result):
+    """Store a finished row's result and queue it for the background sheet writer"""
+    with update_lock:
+        update_results.append(result)
+    writer.submit(result)
 
-        # Build Street View image URL
-        image_url = (
-            f"https://maps.googleapis.com/maps/api/streetview?"
-            f"size=560x430&pano={pano_id}&heading={heading}&pitch=10&fov=70"
-            f"&key={GOOGLE_API_KEY}"
-        )
-
-        # Build Cloudinary filename
-        street = row['address'].replace(",", "").replace(".", "").strip().replace(" ", "_")
-        city = row['city'].replace(",", "").replace(".", "").strip().replace(" ", "_")
-        zip_code = str(row['zip_code']).strip()
-        public_id = f"{street}_{city}_{zip_code}".lower()
-
-        # Upload to Cloudinary
-        hosted_url = upload_to_cloudinary(image_url, public_id=public_id)
-
-        # Store result for batch update
-        with update_lock:
-            update_results.append((index, hosted_url, "Success"))
-            
-    except Exception as e:
-        with update_lock:
-            update_results.append((index, "", f"Error: {str(e)}"))
-        print(f"Error on row {index + 1}: {e}")
+def parse_args():
+    parser = argparse.ArgumentParser(description="Process every sheet row missing an image_URL")
+    parser.add_argument("--engine", choices=["threads", "async", "staged"], default="threads",
+                        help="threads: one worker thread per row; async: asyncio with pooled connections; "
+                             "staged: per-stage worker pools that stream results into the sheet")
+    parser.add_argument("--metrics-file", help="periodically write metrics to <path>.json and <path>.prom")
+    parser.add_argument("--trace", help="write a Chrome trace-event timeline of every row step to <path>")
+    parser.add_argument("--no-asset-index", action="store_true",
+                        help="skip listing existing Cloudinary images at startup (it costs Admin API calls)")
+    parser.add_argument("--plan", action="store_true",
+                        help="only predict API calls, cost and wall time for the pending rows, then exit")
+    return parser.parse_args()
 
 def main():
-    global update_results
+    global update_results, writer
     update_results = []
+    args = parse_args()
+    
+    if args.plan:
+        # Nothing runs, so there are no metrics or trace to write
+        sheet = get_sheet()
+        if not args.no_asset_index:
+            load_existing_assets()
+        print(format_plan(plan_rows(iter_rows_to_process(sheet), asset_listing=not args.no_asset_index)))
+        return
     
-    start_time = time.time()
     print("Starting batch...")
+    if args.metrics_file:
+        metrics.start_exporter(args.metrics_file)
+    if args.trace:
+        tracer.start(args.trace)
     
     sheet = get_sheet()
-    rows_with_indices = get_rows_to_process(sheet)
-    print(f"Starting batch - {len(rows_with_indices)} rows to process.")
+    if not args.no_asset_index:
+        load_existing_assets()
+    writer = SheetWriter(SheetSink(sheet))
+    if args.engine == "staged":
+        # Feed pages into the stages as they are read instead of loading the whole sheet first
+        from utils.stages import process_rows_staged
+        process_rows_staged(iter_rows_to_process(sheet), on_result=record_result)
+        if not update_results:
+            writer.close()
+            print("No rows to process!")
+            return
+    else:
+        # Neighbouring rows back to back share panorama lookups and uploads
+        rows_with_indices = order_rows_spatially(get_rows_to_process(sheet))
+        print(f"Starting batch - {len(rows_with_indices)} rows to process.")
 
-    if not rows_with_indices:
-        print("No rows to process!")
-        return
+        if not rows_with_indices:
+            writer.close()
+            print("No rows to process!")
+            return
 
-    processing_start = time.time()
-    # Process all rows concurrently with higher thread count
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-        futures = [executor.submit(process_row, i, row) for i, row in rows_with_indices]
-        concurrent.futures.wait(futures)
+        if args.engine == "async":
+            from utils.async_engine import process_rows
+            # Each result reaches the writer as its row finishes
+            process_rows(rows_with_indices, on_result=record_result)
+        else:
+            # Process all rows concurrently with higher thread count
+            with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
+                futures = [executor.submit(process_row, i, row) for i, row in rows_with_indices]
+                with tracer.span("wait_for_rows", cat="idle"):
+                    concurrent.futures.wait(futures)
     
-    processing_end = time.time()
-    processing_time = processing_end - processing_start
-
-    # Batch update all results to Google Sheets in single operation
+    # Most results were written while processing; flush whatever is left
     print("Updating Google Sheets...")
-    update_start = time.time()
-    if update_results:
-        batch_update_rows(sheet, update_results)
-        print(f"Updated {len(update_results)} rows in Google Sheets")
-    update_end = time.time()
-    update_time = update_end - update_start
-    
-    total_time = time.time() - start_time
+    writer.close()
+    print(f"Updated {writer.written} rows in Google Sheets ({writer.requests} write requests)")
     
-    print("\n--- TIMING RESULTS ---")
-    print(f"Processing time: {processing_time:.2f} seconds")
-    print(f"Google Sheets update time: {update_time:.2f} seconds") 
-    print(f"Total execution time: {total_time:.2f} seconds")
-    print(f"Average per record: {total_time/len(rows_with_indices):.2f} seconds")
+    # Per-endpoint calls, latency, rate-limit waits and throughput
+    print(metrics.report())
+    metrics.stop_exporter(args.metrics_file)
+    tracer.stop()
     print("Batch complete.")
 
 if __name__ == "__main__":
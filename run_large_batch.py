@@ -1,265 +1,390 @@
-from utils.sheets import get_sheet, get_rows_to_process, batch_update_rows
-from utils.gmaps import get_metadata, get_geocode, calculate_heading
-from utils.cloud import upload_to_cloudinary
-from utils.keys import GOOGLE_API_KEY
+from utils.sheets import get_sheet, get_rows_to_process
+from utils.writer import SheetWriter
+from utils.pipeline import (
+    build_address, process_address, load_existing_assets, order_rows_spatially,
+)
+from utils.adaptive import AdaptiveConcurrency, run_adaptive
+from utils.dedupe import pano_index
+from utils.metrics import metrics
+from utils.tracing import tracer
+from utils.journal import Journal, JOURNAL_PATH
+from utils.sheets import batch_update_rows, SheetSink
+from utils.leases import LeaseManager, LEASE_SIZE, LEASE_CHECK_ROWS, is_claimable
+from utils.planner import plan_rows, format_plan
+from utils.deadline import deadline, admit, MAX_RUNTIME, DRAIN_MARGIN
+from utils.rowio import (
+    FileSource, FileSink, FILE_FLUSH_ROWS, FILE_FLUSH_INTERVAL, default_output_path, read_results,
+    sync_results_to_sheet,
+)
+from utils.watch import SheetWatcher, POLL_INTERVAL, RESCAN_INTERVAL
+from utils.retry import add_overload_listener
 
+import argparse
+import collections
 import concurrent.futures
-import threading
+import os
 import time
-import json
-from datetime import datetime
 
-# Configuration for large batches
-CHUNK_SIZE = 250
-INTER_CHUNK_DELAY = 30  # seconds
-MAX_WORKERS = 8  # Balanced between speed and stability
-MAX_RETRIES = 1  # Single retry for transient errors only
-RETRY_DELAY_BASE = 3  # Reduced delay for single retry
+# Concurrency for large batches is set by the adaptive controller.
+# Shared with worker threads so overload errors shrink the window
+controller = AdaptiveConcurrency()
+# Quota errors mean too many rows are in flight, even when a retry then succeeds
+add_overload_listener(controller.on_overload)
 
-# Thread-safe containers
-update_lock = threading.Lock()
-progress_file = "batch_progress.json"
-
-def save_progress(chunk_num, total_chunks, completed_records, failed_records):
-    """Save progress to file for resumption"""
-    progress = {
-        "timestamp": datetime.now().isoformat(),
-        "chunk_num": chunk_num,
-        "total_chunks": total_chunks,
-        "completed_records": completed_records,
-        "failed_records": failed_records
-    }
-    with open(progress_file, 'w') as f:
-        json.dump(progress, f, indent=2)
-
-def load_progress():
-    """Load previous progress if exists"""
-    try:
-        with open(progress_file, 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return None
-
-def process_row_with_retry(index, row, max_retries=MAX_RETRIES):
-    """Process a single row with smart retry logic"""
-    for attempt in range(max_retries + 1):  # +1 for initial attempt
+def process_row(index, row):
+    """Process a single row; API calls inside retry under their endpoint's policy (utils/retry.py)"""
+    with tracer.span("row", cat="row", row=index):
         try:
-            full_address = f"{row['address']}, {row['city']}, {row['state']} {row['zip_code']}"
-            print(f"  Processing: {full_address}")
-
-            # Get coordinates with timeout
-            target_lat, target_lng = get_geocode(full_address)
-            if not target_lat or not target_lng:
-                raise ValueError("Geocoding failed")
-            
-            pano_lat, pano_lng, pano_id = get_metadata(target_lat, target_lng)
-            if not pano_id or None in [pano_lat, pano_lng]:
-                raise ValueError("Street View metadata not available")
-
-            heading = calculate_heading(pano_lat, pano_lng, target_lat, target_lng)
-
-            # Build Street View image URL
-            image_url = (
-                f"https://maps.googleapis.com/maps/api/streetview?"
-                f"size=560x430&pano={pano_id}&heading={heading}&pitch=10&fov=70"
-                f"&key={GOOGLE_API_KEY}"
-            )
+            print(f"  Processing: {build_address(row)}")
 
-            # Build Cloudinary filename
-            street = row['address'].replace(",", "").replace(".", "").strip().replace(" ", "_")
-            city = row['city'].replace(",", "").replace(".", "").strip().replace(" ", "_")
-            zip_code = str(row['zip_code']).strip()
-            public_id = f"{street}_{city}_{zip_code}".lower()
-
-            # Upload to Cloudinary
-            hosted_url = upload_to_cloudinary(image_url, public_id=public_id)
+            # Geocode, look up the panorama and upload (deduplicated per pano)
+            hosted_url = process_address(row)
             
             return index, hosted_url, "Success"
             
         except Exception as e:
-            error_msg = str(e).lower()
-            
-            # Don't retry for permanent errors
-            if any(permanent_error in error_msg for permanent_error in [
-                "street view metadata not available", 
-                "geocoding failed", 
-                "not found",
-                "zero_results"
-            ]):
-                print(f"    Permanent error on row {index + 1}: {str(e)}")
-                return index, "", f"Error: {str(e)}"
-            
-            # Retry only for transient errors (network, rate limits, etc.)
-            if attempt < max_retries:
-                delay = RETRY_DELAY_BASE
-                print(f"    Retry {attempt + 1}/{max_retries} for row {index + 1} after {delay}s: {str(e)}")
-                time.sleep(delay)
-            else:
-                print(f"    Final error on row {index + 1}: {str(e)}")
-                return index, "", f"Error: {str(e)}"
+            print(f"    Error on row {index + 1}: {str(e)}")
+            return index, "", f"Error: {str(e)}"
 
-def process_chunk(chunk_data, chunk_num, total_chunks):
-    """Process a single chunk of records"""
-    print(f"\n=== CHUNK {chunk_num}/{total_chunks} - {len(chunk_data)} records ===")
-    chunk_start_time = time.time()
+def process_all(rows_with_indices, writer, engine="threads", ordered=True, executor=None):
+    """Process every row, streaming results to the writer; returns a Counter of processed and successful rows"""
+    totals = collections.Counter()
+    # Neighbouring rows back to back share panorama lookups and uploads
+    if ordered:
+        rows_with_indices = order_rows_spatially(rows_with_indices)
+    # No new rows start once the run is draining
+    rows_with_indices = admit(rows_with_indices, deadline)
     
-    chunk_results = []
+    # Only counts are kept, so a long file or watch session does not grow in memory.
+    # Each result is journaled as soon as its row finishes, not when the batch does
+    def on_result(result):
+        count_results(totals, [result])
+        writer.submit(result)
     
-    # Process chunk with thread pool
-    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = [executor.submit(process_row_with_retry, i, row) for i, row in chunk_data]
-        
-        # Wait with timeout to prevent hanging
-        for future in concurrent.futures.as_completed(futures, timeout=600):  # 10 minute timeout
-            result = future.result()
-            if result:
-                chunk_results.append(result)
-    
-    chunk_time = time.time() - chunk_start_time
-    successful = len([r for r in chunk_results if r[1]])  # Has image_url
-    failed = len(chunk_results) - successful
+    if engine == "async":
+        from utils.async_engine import process_rows
+        process_rows(rows_with_indices, on_result=on_result)
+    elif engine == "staged":
+        from utils.stages import process_rows_staged
+        process_rows_staged(rows_with_indices, on_result=on_result)
+    else:
+        # One persistent pool; the controller decides how many rows are in flight
+        run_adaptive(rows_with_indices, process_row, on_result, controller,
+                     is_success=lambda result: result[2] == "Success", deadline=deadline, executor=executor)
     
-    print(f"Chunk {chunk_num} completed: {successful} successful, {failed} failed ({chunk_time:.1f}s)")
-    
-    return chunk_results
+    return totals
 
-def main():
-    total_start_time = time.time()
+def count_results(totals, results):
+    """Add (index, url, status) results to the processed/successful counts"""
+    for _, image_url, _ in results:
+        totals["processed"] += 1
+        if image_url:
+            totals["successful"] += 1
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Process a large sheet with adaptive concurrency")
+    parser.add_argument("--engine", choices=["threads", "async", "staged"], default="threads",
+                        help="threads: AIMD-controlled rows in flight; async: asyncio with pooled connections; "
+                             "staged: per-stage worker pools with bounded queues")
+    parser.add_argument("--metrics-file", help="periodically write metrics to <path>.json and <path>.prom")
+    parser.add_argument("--trace", help="write a Chrome trace-event timeline of every row step to <path>")
+    parser.add_argument("--no-asset-index", action="store_true",
+                        help="skip listing existing Cloudinary images at startup (it costs Admin API calls)")
+    parser.add_argument("--owner", help="runner ID for row leases, so several runners can share a sheet "
+                                        "(default: hostname-pid when --lease-size is given)")
+    parser.add_argument("--lease-size", type=int, help=f"rows to lease at a time (default {LEASE_SIZE} with --owner)")
+    parser.add_argument("--input", help="read rows from a .csv, .jsonl or .parquet file instead of the sheet")
+    parser.add_argument("--output", help="results file for --input (default: <input>.results.<ext>)")
+    parser.add_argument("--sync-sheet", action="store_true",
+                        help="with --input, write the results file back into the sheet at the end")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and process rows as they are added to the sheet")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL,
+                        help=f"with --watch, seconds between checks for new rows (default {POLL_INTERVAL:g})")
+    parser.add_argument("--rescan-interval", type=float, default=RESCAN_INTERVAL,
+                        help="with --watch, seconds between full re-reads that find rows edited in place "
+                             f"(default {RESCAN_INTERVAL:g}; 0: never)")
+    parser.add_argument("--max-runtime", type=float,
+                        help=f"seconds before the run stops, keeping every finished result "
+                             f"(default {MAX_RUNTIME:g}, or no limit with --watch; 0: no limit)")
+    parser.add_argument("--drain-margin", type=float, default=DRAIN_MARGIN,
+                        help="stop starting rows this many seconds before --max-runtime")
+    parser.add_argument("--plan", action="store_true",
+                        help="only predict API calls, cost and wall time for the pending rows, then exit")
+    args = parser.parse_args()
+    if args.input and (args.owner or args.lease_size):
+        parser.error("row leases need the sheet; they cannot be combined with --input")
+    if args.watch and (args.input or args.owner or args.lease_size):
+        parser.error("--watch processes one sheet on its own; it cannot be combined with --input or leases")
+    if args.max_runtime is None:
+        args.max_runtime = 0 if args.watch else MAX_RUNTIME
+    return args
+
+def pending_rows(rows_with_indices, journal, owner=None):
+    """Rows not already journaled as successful and not leased by another runner"""
+    journal.track(rows_with_indices, build_address)
+    return [
+        (i, row) for i, row in rows_with_indices
+        if not journal.is_done(i, build_address(row)) and is_claimable(row.get("Processing Status"), owner)
+    ]
+
+def stream_pending_rows(source, journal, done=()):
+    """Lazily yield rows from a file source that have not already succeeded (journal or results file)"""
+    for index, row in source:
+        if index in done:
+            continue
+        journal.track([(index, row)], build_address)
+        if not journal.is_done(index, build_address(row)):
+            yield index, row
+
+def sheet_journal(args):
+    """The loaded row-level journal of a sheet run; one per named runner"""
+    return Journal(f"batch_journal.{args.owner}.jsonl" if args.owner else JOURNAL_PATH).load()
+
+def replay_journal(sheet, journal):
+    """Write results that finished but never reached the sheet, instead of recomputing them"""
+    replay = journal.unflushed()
+    if replay:
+        print(f"Replaying {len(replay)} journaled results into the sheet...")
+        batch_update_rows(sheet, replay)
+        journal.mark_flushed(replay)
+
+def process_file(args):
+    """Stream rows from --input and append results to --output; returns the row counts"""
+    source = FileSource(args.input)
+    output = args.output or default_output_path(args.input)
+    sink = FileSink(output)
+    journal = Journal(f"{output}.journal.jsonl").load()
+    print(f"Streaming rows from {args.input}, results to {output}")
     
-    # Set up watchdog timer as backup exit mechanism
-    import threading
-    def emergency_exit():
-        time.sleep(1800)  # 30 minutes max runtime
-        print("EMERGENCY EXIT: Maximum runtime exceeded!")
-        import os
-        os._exit(1)
+    # Successful rows in an earlier results file count as done, like rows with image_URL in the sheet
+    done = set()
+    if os.path.exists(output):
+        done = {index for index, image_url, _ in read_results(output) if image_url}
+        print(f"Resuming: {len(done)} rows already in {output}")
     
-    watchdog = threading.Thread(target=emergency_exit, daemon=True)
-    watchdog.start()
+    if not args.no_asset_index:
+        load_existing_assets()
+    writer = SheetWriter(sink, flush_rows=FILE_FLUSH_ROWS, flush_interval=FILE_FLUSH_INTERVAL, journal=journal)
     
-    print("Starting large batch processing...")
-    print(f"Configuration: {CHUNK_SIZE} records/chunk, {INTER_CHUNK_DELAY}s delay, {MAX_WORKERS} threads")
+    # Sorting would need every row in memory, so file rows run in file order
+    totals = process_all(stream_pending_rows(source, journal, done), writer, engine=args.engine, ordered=False)
+    writer.close()
     
-    # Check for previous progress
-    previous_progress = load_progress()
-    if previous_progress:
-        print(f"Previous run found: Chunk {previous_progress['chunk_num']}/{previous_progress['total_chunks']}")
-        try:
-            resume = input("Resume from previous run? (y/n): ").lower().strip() == 'y'
-            if not resume:
-                previous_progress = None
-        except EOFError:
-            # Auto-skip resume in automated runs
-            print("Starting fresh run...")
-            previous_progress = None
+    # Rows are only tracked once read, so journaled results that never reached
+    # the file are found (and checked against the row's address) after the pass
+    replay = journal.unflushed()
+    if replay:
+        print(f"Replaying {len(replay)} journaled results into {output}...")
+        sink.write(replay)
+        journal.mark_flushed(replay)
+    sink.close()
+    
+    if args.sync_sheet:
+        synced = sync_results_to_sheet(output, get_sheet())
+        print(f"Synced {synced} results to Google Sheets")
     
+    journal.close(remove=journal.pending_count() == 0)
+    return totals
+
+def plan_run(args):
+    """Print the expected calls and wall time for the rows a real run would process"""
+    if not args.no_asset_index:
+        load_existing_assets()
+    if args.input:
+        output = args.output or default_output_path(args.input)
+        done = set()
+        if os.path.exists(output):
+            done = {index for index, image_url, _ in read_results(output) if image_url}
+        journal = Journal(f"{output}.journal.jsonl").load()
+        rows = stream_pending_rows(FileSource(args.input), journal, done)
+    else:
+        journal = sheet_journal(args)
+        rows = pending_rows(get_rows_to_process(get_sheet()), journal, args.owner)
+    print(format_plan(plan_rows(rows, sheet_writes=not args.input or args.sync_sheet,
+                                asset_listing=not args.no_asset_index)))
+
+def process_sheet(args):
+    """Process the sheet's pending rows, optionally as one of several leasing runners"""
     # Get sheet and rows to process
     sheet = get_sheet()
+    leases = None
+    if args.owner or args.lease_size:
+        leases = LeaseManager(sheet, owner=args.owner, lease_size=args.lease_size or LEASE_SIZE)
+    
+    # Row-level journal from any interrupted run
+    journal = sheet_journal(args)
     all_rows_with_indices = get_rows_to_process(sheet)
     
+    # Skip rows that already succeeded for the same address; errored rows are retried.
+    # Checked before the replay below, which drops the results it writes from the journal
+    journaled = len(all_rows_with_indices)
+    all_rows_with_indices = pending_rows(all_rows_with_indices, journal, leases.owner if leases else None)
+    journaled -= len(all_rows_with_indices)
+    
+    replay_journal(sheet, journal)
+    if journaled:
+        print(f"Resuming: {journaled} rows already done or leased elsewhere")
+    
     if not all_rows_with_indices:
         print("No rows to process!")
-        # Clean up progress file if no work to do
-        try:
-            import os
-            os.remove(progress_file)
-            print("Cleaned up progress file.")
-        except FileNotFoundError:
-            pass
-        return
+        # Nothing left to resume
+        journal.close(remove=True)
+        return collections.Counter()
     
+    if not args.no_asset_index:
+        load_existing_assets()
+    writer = SheetWriter(SheetSink(sheet), journal=journal)
     total_records = len(all_rows_with_indices)
-    total_chunks = (total_records + CHUNK_SIZE - 1) // CHUNK_SIZE
     
-    print(f"Total: {total_records} records in {total_chunks} chunks")
+    print(f"Total: {total_records} records")
     
-    # Determine starting point
-    start_chunk = 1
-    all_results = []
+    if leases:
+        # Work one leased block at a time, re-reading the status column to see other runners' claims
+        print(f"Leasing up to {leases.lease_size} rows at a time as {leases.owner}")
+        totals = collections.Counter()
+        while deadline.admitting() and leases.available(all_rows_with_indices):
+            block = leases.claim(all_rows_with_indices)
+            if block:
+                print(f"  Leased {len(block)} rows")
+                remaining = order_rows_spatially(block)
+                while remaining and deadline.admitting():
+                    chunk, remaining = remaining[:LEASE_CHECK_ROWS], remaining[LEASE_CHECK_ROWS:]
+                    totals.update(process_all(chunk, writer, engine=args.engine, ordered=False))
+                    # Drop rows another runner took over meanwhile, and keep the rest leased
+                    remaining = leases.refresh(remaining)
+                error = writer.flush()
+                if error:
+                    # Results stay journaled; the next run replays them
+                    deadline.stop(f"Sheet writes keep failing ({error})")
+            # Only statuses change between blocks, so the rest of the first read is kept
+            all_rows_with_indices = pending_rows(leases.reload_statuses(all_rows_with_indices), journal, leases.owner)
+    else:
+        totals = process_all(all_rows_with_indices, writer, engine=args.engine)
+    print(f"  Updated {writer.written} rows so far ({writer.pending()} waiting)")
+    if args.engine == "threads":
+        print(f"  Final concurrency limit: {controller.limit}")
     
-    if previous_progress and previous_progress.get('chunk_num', 0) < total_chunks:
-        start_chunk = previous_progress['chunk_num'] + 1
-        print(f"Resuming from chunk {start_chunk}")
-    elif previous_progress and previous_progress.get('chunk_num', 0) >= total_chunks:
-        print("Previous run was already completed! Starting fresh.")
-        previous_progress = None
-        # Clean up old progress file
-        try:
-            import os
-            os.remove(progress_file)
-        except FileNotFoundError:
-            pass
+    writer.close()
     
-    # Process chunks
-    for chunk_num in range(start_chunk, total_chunks + 1):
-        # Create chunk
-        start_idx = (chunk_num - 1) * CHUNK_SIZE
-        end_idx = min(start_idx + CHUNK_SIZE, total_records)
-        chunk_data = all_rows_with_indices[start_idx:end_idx]
-        
-        # Process chunk
-        chunk_results = process_chunk(chunk_data, chunk_num, total_chunks)
-        all_results.extend(chunk_results)
-        
-        # Update Google Sheets for this chunk
-        if chunk_results:
-            print(f"  Updating Google Sheets for chunk {chunk_num}...")
-            batch_update_rows(sheet, chunk_results)
-            print(f"  Updated {len(chunk_results)} rows")
-        
-        # Save progress
-        completed = len([r for r in all_results if r[1]])
-        failed = len(all_results) - completed
-        save_progress(chunk_num, total_chunks, completed, failed)
-        
-        # Inter-chunk delay (except for last chunk)
-        if chunk_num < total_chunks:
-            print(f"  Waiting {INTER_CHUNK_DELAY}s before next chunk...")
-            time.sleep(INTER_CHUNK_DELAY)
+    # The journal is only needed while some result is not yet on the sheet
+    if journal.pending_count() == 0:
+        journal.close(remove=True)
+        print("Journal cleaned up.")
+    else:
+        journal.close()
+        print(f"{journal.pending_count()} results not yet written; they will be replayed next run.")
+    return totals
+
+def watch_sheet(args):
+    """Process pending rows, then keep processing rows as they are added until the run is stopped"""
+    sheet = get_sheet()
+    journal = sheet_journal(args)
+    watcher = SheetWatcher(sheet, rescan_interval=args.rescan_interval)
+    if not args.no_asset_index:
+        load_existing_assets()
+    writer = SheetWriter(SheetSink(sheet), journal=journal)
+    # One pool for the whole session, so worker threads and their connections stay warm between polls
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=controller.max_limit)
+    totals = collections.Counter()
+    first = True
+    
+    print(f"Watching the sheet for new rows every {args.poll_interval:g}s (Ctrl+C to stop)")
+    try:
+        while deadline.admitting():
+            try:
+                rows = watcher.poll()
+            except Exception as e:
+                # A failed read must not end the session; the same range is read next poll
+                print(f"  Reading new rows failed, retrying in {args.poll_interval:g}s: {e}")
+                deadline.sleep(args.poll_interval)
+                continue
+            rows = pending_rows(rows, journal)
+            
+            if first:
+                # After pending_rows, so replayed rows are not processed again
+                replay_journal(sheet, journal)
+                first = False
+            
+            if not rows:
+                deadline.sleep(args.poll_interval)
+                continue
+            print(f"  {len(rows)} new rows to process (sheet rows up to {watcher.next_row - 1})")
+            totals.update(process_all(rows, writer, engine=args.engine, executor=executor))
+            # New results show up in the sheet right away, not after the next flush interval
+            error = writer.flush()
+            if error:
+                # Results stay journaled; the next run replays them
+                deadline.stop(f"Sheet writes keep failing ({error})")
+            else:
+                # Everything is on the sheet, so the journal has nothing left to replay
+                journal.compact()
+    finally:
+        # run_adaptive() has waited for its rows; this only joins the idle workers
+        executor.shutdown(wait=True)
+        writer.close()
+    
+    if journal.pending_count() == 0:
+        journal.close(remove=True)
+    else:
+        journal.close()
+        print(f"{journal.pending_count()} results not yet written; they will be replayed next run.")
+    return totals
+
+def main():
+    args = parse_args()
+    total_start_time = time.time()
+    
+    if args.plan:
+        plan_run(args)
+        return
+    
+    # Near the deadline (or on Ctrl+C/SIGTERM) the run stops taking rows and
+    # drains, so every finished result still reaches the sheet
+    deadline.start(args.max_runtime, args.drain_margin)
+    deadline.install_signal_handlers()
+    
+    if args.metrics_file:
+        metrics.start_exporter(args.metrics_file)
+    if args.trace:
+        tracer.start(args.trace)
+    
+    print("Starting large batch processing...")
+    print(f"Configuration: {controller.limit} rows in flight to start "
+          f"({controller.min_limit}-{controller.max_limit}), {args.engine} engine")
+    
+    if args.input:
+        totals = process_file(args)
+    elif args.watch:
+        totals = watch_sheet(args)
+    else:
+        totals = process_sheet(args)
     
     # Final summary
     print("DEBUG: Starting final summary...")
     total_time = time.time() - total_start_time
-    successful_records = len([r for r in all_results if r[1]])
-    failed_records = len(all_results) - successful_records
+    successful_records = totals["successful"]
+    failed_records = totals["processed"] - successful_records
     print("DEBUG: Calculations complete, printing results...")
     
     print("\n" + "="*60)
     print("FINAL RESULTS")
     print("="*60)
-    print(f"Total records processed: {len(all_results)}")
+    print(f"Total records processed: {totals['processed']}")
     print(f"Successful: {successful_records}")
     print(f"Failed: {failed_records}")
-    print(f"Success rate: {successful_records/len(all_results)*100:.1f}%")
+    print(f"Success rate: {successful_records/max(totals['processed'], 1)*100:.1f}%")
     print(f"Total execution time: {total_time/60:.1f} minutes")
-    print(f"Average per record: {total_time/len(all_results):.2f} seconds")
-    
-    # Clean up progress file after successful completion
-    try:
-        import os
-        os.remove(progress_file)
-        print("Progress file cleaned up.")
-    except FileNotFoundError:
-        pass
+    if deadline.reason:
+        print(f"Stopped early ({deadline.reason}); remaining rows are left for the next run")
+    dedupe_stats = pano_index.stats()
+    print(f"Distinct images uploaded: {dedupe_stats['images']} ({dedupe_stats['metadata']} metadata lookups)")
+    print(metrics.report())
+    metrics.stop_exporter(args.metrics_file)
+    tracer.stop()
         
     print("Large batch processing complete!")
     print("Exiting program...")
-    
-    # Force clean exit - multiple methods to ensure termination
-    import sys
-    import os
-    
-    try:
-        # Method 1: Clean exit
-        sys.exit(0)
-    except:
-        try:
-            # Method 2: Force exit
-            os._exit(0)
-        except:
-            # Method 3: Nuclear option
-            import subprocess
-            subprocess.run(["taskkill", "/F", "/PID", str(os.getpid())], shell=True)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
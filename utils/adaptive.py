@@ -0,0 +1,130 @@
+import concurrent.futures
+import threading
+import time
+
+from .tracing import tracer
+
+# AIMD bounds and tuning for rows in flight
+MIN_CONCURRENCY = 2
+MAX_CONCURRENCY = 64
+INITIAL_CONCURRENCY = 8
+DECREASE_FACTOR = 0.7  # Multiplicative cut on overload
+LATENCY_TOLERANCE = 2.0  # Back off when row latency exceeds this multiple of the best seen
+LATENCY_DECREASE_FACTOR = 0.9
+EWMA_WEIGHT = 0.1
+COOLDOWN = 2.0  # Seconds between decreases, so one burst of errors counts once
+PROGRESS_INTERVAL = 30  # Seconds between progress lines
+
+
+class AdaptiveConcurrency:
+    """AIMD controller for how many rows may be in flight
+
+    Every successful row adds 1/limit (about +1 per round trip of rows).
+    An OVER_QUERY_LIMIT/rate-limit error cuts the limit by DECREASE_FACTOR,
+    and a smoothed row latency well above the best observed trims it
+    gently, so the run settles just under what the APIs will take.
+    """
+
+    def __init__(self, initial=INITIAL_CONCURRENCY, min_limit=MIN_CONCURRENCY, max_limit=MAX_CONCURRENCY):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self._limit = float(initial)
+        self._lock = threading.Lock()
+        self._latency = None
+        self._best_latency = None
+        self._last_decrease = 0.0
+
+    @property
+    def limit(self):
+        with self._lock:
+            return int(self._limit)
+
+    def _decrease(self, factor):
+        now = time.monotonic()
+        if now - self._last_decrease >= COOLDOWN:
+            self._limit = max(self.min_limit, self._limit * factor)
+            self._last_decrease = now
+
+    def on_overload(self):
+        """Called when an API reports its quota is exhausted"""
+        with self._lock:
+            self._decrease(DECREASE_FACTOR)
+
+    def on_success(self, latency):
+        with self._lock:
+            if self._latency is None:
+                self._latency = latency
+            else:
+                self._latency += EWMA_WEIGHT * (latency - self._latency)
+            if self._best_latency is None or self._latency < self._best_latency:
+                self._best_latency = self._latency
+
+            if self._latency > self._best_latency * LATENCY_TOLERANCE:
+                self._decrease(LATENCY_DECREASE_FACTOR)
+                # Let the baseline drift up so a permanently slower API is not punished forever
+                self._best_latency *= 1.05
+            else:
+                self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+
+
+def run_adaptive(rows_with_indices, task, on_result, controller, is_success=None, deadline=None, executor=None):
+    """Keep controller.limit rows in flight over one sliding window
+
+    task(index, row) runs on a persistent thread pool and its result is
+    passed to on_result() as soon as it finishes; new rows are admitted
+    whenever the controller allows more in flight. Once a deadline has
+    passed no more rows start, but rows already running are waited for:
+    their API calls have per-call timeouts and stop retrying while the run
+    drains, and their results are already paid for. A caller-owned
+    executor is reused and left running, so a long-lived caller keeps its
+    worker threads between calls.
+    """
+    rows = iter(rows_with_indices)
+    pending = {}
+    completed = 0
+    started = time.time()
+    last_progress = started
+    exhausted = False
+
+    owned = executor is None
+    if owned:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=controller.max_limit)
+    try:
+        while True:
+            if not exhausted and deadline is not None and deadline.expired():
+                exhausted = True
+                print(f"  Deadline passed: finishing {len(pending)} rows still in flight")
+            while not exhausted and len(pending) < controller.limit:
+                try:
+                    index, row = next(rows)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[executor.submit(task, index, row)] = time.monotonic()
+
+            if not pending:
+                break
+
+            with tracer.span("wait_for_rows", cat="idle", in_flight=len(pending)):
+                done, _ = concurrent.futures.wait(pending, timeout=1, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                latency = time.monotonic() - pending.pop(future)
+                result = future.result()
+                if is_success is None or is_success(result):
+                    controller.on_success(latency)
+                on_result(result)
+                completed += 1
+
+            if time.time() - last_progress >= PROGRESS_INTERVAL:
+                last_progress = time.time()
+                rate = completed / (last_progress - started)
+                print(f"  Progress: {completed} rows done, {len(pending)} in flight, "
+                      f"limit {controller.limit}, {rate:.1f} rows/sec")
+    finally:
+        # Only reached with rows pending when on_result() or the caller raised;
+        # rows that have not started are dropped, running ones still finish
+        for future in pending:
+            future.cancel()
+        if owned:
+            executor.shutdown(wait=True)
+    return completed
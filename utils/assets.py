@@ -0,0 +1,45 @@
+import threading
+
+from .cloud import list_assets
+from .metrics import metrics
+
+
+class AssetIndex:
+    """public_id -> secure_url of images already hosted on Cloudinary
+
+    Loaded once at startup with a paged Admin API listing, so rows whose
+    image was uploaded by an earlier run (but whose sheet write was lost or
+    cleared) get their URL back without any Google or upload calls.
+    """
+
+    def __init__(self):
+        self._urls = {}
+        self._lock = threading.Lock()
+
+    def load(self, prefix=""):
+        """List every asset under prefix; a failed listing keeps the pages already read"""
+        try:
+            for public_id, secure_url in list_assets(prefix):
+                with self._lock:
+                    self._urls[public_id] = secure_url
+        except Exception as e:
+            print(f"  Could not list all existing Cloudinary assets: {e}")
+        return len(self._urls)
+
+    def get(self, public_id):
+        with self._lock:
+            url = self._urls.get(public_id)
+        if url:
+            metrics.inc("asset_index_hits_total")
+        return url
+
+    def __contains__(self, public_id):
+        with self._lock:
+            return public_id in self._urls
+
+    def __len__(self):
+        return len(self._urls)
+
+
+# Existing assets for the current run
+asset_index = AssetIndex()
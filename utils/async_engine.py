@@ -0,0 +1,296 @@
+import asyncio
+import json
+import os
+import time
+
+import cloudinary.utils
+
+try:
+    import aiohttp
+except ImportError:  # Optional: only needed for the async engine
+    aiohttp = None
+
+from .gmaps import GEOCODE_URL, METADATA_URL, parse_geocode, parse_metadata
+from .geocache import geocode_cache, normalize_address
+from .offline_geocoder import offline_geocoder
+from .ratelimit import limiter
+from .metrics import metrics
+from .tracing import tracer
+from .dedupe import COORD_PRECISION
+from .assets import asset_index
+from .deadline import deadline
+from .variants import VARIANTS, eager_transformations
+from .errors import PermanentError, PipelineError, TransientError, error_for_status
+from .retry import call_async
+from .pipeline import (
+    IMAGE_PARAMS, build_address, build_image_url, build_public_id, pano_heading,
+)
+from .cloud import ALIAS_TAG_PREFIX
+from .keys import GOOGLE_API_KEY, CLOUDINARY_CONFIG
+
+CLOUDINARY_UPLOAD_PREFIX = os.environ.get("CLOUDINARY_UPLOAD_PREFIX") or "https://api.cloudinary.com"
+CLOUDINARY_UPLOAD_URL = CLOUDINARY_UPLOAD_PREFIX + "/v1_1/{cloud_name}/image/upload"
+CLOUDINARY_TAGS_URL = CLOUDINARY_UPLOAD_PREFIX + "/v1_1/{cloud_name}/image/tags"
+CLOUDINARY_UPLOAD_MODE = os.environ.get("CLOUDINARY_UPLOAD_MODE", "proxy")  # See utils/cloud.py
+
+MAX_IN_FLIGHT = 200  # Rows in flight at once; the rate limiter sets the real pace
+CONNECTIONS_PER_HOST = 50
+REQUEST_TIMEOUT = 30
+
+
+async def _acquire(endpoint):
+    delay = limiter.reserve(endpoint)
+    if delay > 0:
+        metrics.inc("rate_limit_wait_seconds_total", delay, endpoint=endpoint)
+        with tracer.span("rate_limit_wait", cat="wait", endpoint=endpoint):
+            await asyncio.sleep(delay)
+
+
+class AsyncEngine:
+    """Drives geocode, metadata, image fetch and upload for many rows on one event loop
+
+    All requests share one pooled aiohttp session, and results have the same
+    (index, url, status) shape that batch_update_rows consumes.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self._inflight = {}
+
+    async def _once(self, key, fn):
+        # Same sharing rule as PanoIndex, but with asyncio futures
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._inflight[key] = future
+
+            def forget_failure(done):
+                # Failures are not cached, so a later row can retry
+                if not done.cancelled() and done.exception() is not None:
+                    self._inflight.pop(key, None)
+
+            future.add_done_callback(forget_failure)
+        return await asyncio.shield(future)
+
+    async def _get_json(self, endpoint, url, params):
+        with metrics.timed(endpoint):
+            try:
+                async with self.session.get(url, params=params) as res:
+                    if res.status != 200:
+                        raise error_for_status(res.status, f"{endpoint} request returned HTTP {res.status}", endpoint)
+                    body = await res.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise TransientError(f"{endpoint} request failed: {e}", endpoint) from e
+        metrics.inc("bytes_transferred_total", len(body), endpoint=endpoint)
+        return json.loads(body)
+
+    async def geocode(self, address):
+        cached = geocode_cache.get(address)
+        if cached is not None:
+            metrics.inc("geocode_cache_hits_total")
+            return cached
+        located = offline_geocoder.lookup(address)
+        if located is not None:
+            metrics.inc("offline_geocode_hits_total")
+            return located
+        # Duplicate addresses in flight together share one request
+        return await self._once(("geocode", normalize_address(address)),
+                                lambda: call_async("geocode", lambda: self._fetch_geocode(address)))
+
+    async def _fetch_geocode(self, address):
+        await _acquire("geocode")
+        data = await self._get_json("geocode", GEOCODE_URL, {"address": address, "key": GOOGLE_API_KEY})
+        return parse_geocode(address, data)
+
+    async def metadata(self, lat, lng):
+        await _acquire("metadata")
+        data = await self._get_json("metadata", METADATA_URL, {"location": f"{lat},{lng}", "key": GOOGLE_API_KEY})
+        return parse_metadata(data)
+
+    async def download(self, image_url):
+        await _acquire("static")
+        with metrics.timed("static"):
+            try:
+                async with self.session.get(image_url) as res:
+                    if res.status != 200:
+                        raise error_for_status(res.status, f"Failed to download image: {res.status}", "static")
+                    image = await res.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise TransientError(f"Failed to download image: {e}", "static") from e
+        metrics.inc("bytes_transferred_total", len(image), endpoint="static")
+        return image
+
+    async def upload(self, image_url, public_id):
+        if CLOUDINARY_UPLOAD_MODE == "fetch":
+            # Cloudinary downloads the image itself
+            image = None
+        else:
+            # Downloaded once; an upload retry sends the same bytes again
+            image = await call_async("static", lambda: self.download(image_url))
+        return await call_async("cloudinary", lambda: self._upload(image_url, image, public_id))
+
+    async def _upload(self, image_url, image, public_id):
+        if image is None:
+            # Cloudinary's fetch still spends Street View quota
+            await _acquire("static")
+        await _acquire("cloudinary")
+        params = {"timestamp": int(time.time())}
+        if public_id:
+            params["public_id"] = public_id
+        if VARIANTS:
+            params["eager"] = cloudinary.utils.build_eager(eager_transformations())
+        params["signature"] = cloudinary.utils.api_sign_request(params, CLOUDINARY_CONFIG["api_secret"])
+        params["api_key"] = CLOUDINARY_CONFIG["api_key"]
+
+        form = aiohttp.FormData()
+        for name, value in params.items():
+            form.add_field(name, str(value))
+        if image is None:
+            form.add_field("file", image_url)
+        else:
+            form.add_field("file", image, filename="streetview.jpg", content_type="image/jpeg")
+        url = CLOUDINARY_UPLOAD_URL.format(cloud_name=CLOUDINARY_CONFIG["cloud_name"])
+        with metrics.timed("cloudinary"):
+            try:
+                async with self.session.post(url, data=form) as res:
+                    result = await res.json(content_type=None)
+                    if res.status != 200:
+                        message = f"Cloudinary upload failed: {result.get('error', {}).get('message', res.status)}"
+                        # In fetch mode, 400 is what a failed server-side fetch of the image
+                        # URL looks like; when the bytes were sent it is a rejected request
+                        if res.status == 400 and image is None:
+                            raise TransientError(message, "cloudinary")
+                        raise error_for_status(res.status, message, "cloudinary")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise TransientError(f"Cloudinary upload failed: {e}", "cloudinary") from e
+        if image is not None:
+            metrics.inc("bytes_transferred_total", len(image), endpoint="cloudinary")
+        return result["secure_url"]
+
+    async def alias(self, public_id, alias):
+        """cloud.alias_asset() on the event loop: tag the image so the asset index also finds it as alias"""
+        async def add_tag():
+            await _acquire("cloudinary")
+            params = {"timestamp": int(time.time()), "tag": ALIAS_TAG_PREFIX + alias,
+                      "public_ids": [public_id], "command": "add"}
+            params["signature"] = cloudinary.utils.api_sign_request(params, CLOUDINARY_CONFIG["api_secret"])
+            params["api_key"] = CLOUDINARY_CONFIG["api_key"]
+            form = aiohttp.FormData()
+            for name, value in params.items():
+                if name == "public_ids":
+                    form.add_field("public_ids[]", public_id)
+                else:
+                    form.add_field(name, str(value))
+            url = CLOUDINARY_TAGS_URL.format(cloud_name=CLOUDINARY_CONFIG["cloud_name"])
+            with metrics.timed("cloudinary"):
+                try:
+                    async with self.session.post(url, data=form) as res:
+                        result = await res.json(content_type=None)
+                        if res.status != 200:
+                            message = f"Cloudinary tag failed: {result.get('error', {}).get('message', res.status)}"
+                            raise error_for_status(res.status, message, "cloudinary")
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    raise TransientError(f"Cloudinary tag failed: {e}", "cloudinary") from e
+
+        try:
+            await call_async("cloudinary", add_tag)
+        except PipelineError as e:
+            # Best effort, as in cloud.alias_asset()
+            print(f"    Could not record {alias} as an alias of {public_id}: {e}")
+
+    async def process_address(self, row):
+        hosted_url = asset_index.get(build_public_id(row))
+        if hosted_url:
+            return hosted_url
+
+        target_lat, target_lng = await self.geocode(build_address(row))
+        if not target_lat or not target_lng:
+            raise PermanentError("Geocoding failed")
+
+        coords = (round(target_lat, COORD_PRECISION), round(target_lng, COORD_PRECISION))
+        pano_lat, pano_lng, pano_id = await self._once(
+            ("metadata", coords), lambda: call_async("metadata", lambda: self.metadata(target_lat, target_lng))
+        )
+        if not pano_id or None in [pano_lat, pano_lng]:
+            raise PermanentError("Street View metadata not available")
+
+        heading = pano_heading(pano_lat, pano_lng, target_lat, target_lng)
+        image_url = build_image_url(pano_id, heading)
+        public_id = build_public_id(row)
+
+        async def upload():
+            return await self.upload(image_url, public_id), public_id
+
+        # Rows sharing another row's upload tag it with their own public_id, as in PanoIndex.host()
+        url, owner = await self._once(("image", pano_id, heading, IMAGE_PARAMS), upload)
+        if owner != public_id:
+            await self.alias(owner, public_id)
+        return url
+
+    async def process_row(self, index, row):
+        # API calls inside retry under their endpoint's policy (utils/retry.py)
+        with tracer.span("row", cat="row", row=index):
+            try:
+                print(f"  Processing: {build_address(row)}")
+                hosted_url = await self.process_address(row)
+                return index, hosted_url, "Success"
+            except Exception as e:
+                print(f"    Error on row {index + 1}: {str(e)}")
+                return index, "", f"Error: {str(e)}"
+
+
+async def process_rows_async(rows_with_indices, max_in_flight=MAX_IN_FLIGHT, on_result=None):
+    """Process (index, row) pairs and return their (index, url, status) results
+
+    max_in_flight feeders pull rows from the iterator one at a time, so only
+    the rows in flight are held and rows_with_indices can be a stream. With
+    on_result, each result is passed to it as its row finishes and none are
+    kept. Rows not started before the run deadline are left out, and rows
+    still running when it passes are cancelled.
+    """
+    if aiohttp is None:
+        raise RuntimeError("The async engine needs aiohttp: pip install aiohttp")
+
+    connector = aiohttp.TCPConnector(limit=max_in_flight, limit_per_host=CONNECTIONS_PER_HOST)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    rows = iter(rows_with_indices)
+    collected = []
+    in_flight = 0
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        engine = AsyncEngine(session)
+
+        async def feed():
+            nonlocal in_flight
+            # next() never yields to the event loop, so feeders never take the same row
+            for index, row in rows:
+                # Rows not started before the drain are left for the next run
+                if not deadline.admitting():
+                    return
+                in_flight += 1
+                try:
+                    result = await engine.process_row(index, row)
+                finally:
+                    in_flight -= 1
+                if on_result is not None:
+                    on_result(result)
+                else:
+                    collected.append(result)
+
+        feeders = [asyncio.ensure_future(feed()) for _ in range(max_in_flight)]
+        remaining = deadline.remaining()
+        done, pending = await asyncio.wait(feeders, timeout=None if remaining is None else max(remaining, 0))
+        if pending:
+            # Past the deadline: cancel what is still running and keep what finished
+            print(f"  Deadline passed: cancelling {in_flight} rows still in flight")
+            for feeder in pending:
+                feeder.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        for feeder in done:
+            feeder.result()  # Re-raise anything that stopped a feeder early
+        return None if on_result is not None else collected
+
+
+def process_rows(rows_with_indices, max_in_flight=MAX_IN_FLIGHT, on_result=None):
+    """Blocking wrapper for callers outside an event loop"""
+    return asyncio.run(process_rows_async(rows_with_indices, max_in_flight, on_result))
@@ -1,26 +1,166 @@
+import os
+import threading
+
 import requests
-import cloudinary
-import cloudinary.uploader
+
 from utils.keys import CLOUDINARY_CONFIG
+from utils.ratelimit import limiter
+from utils.metrics import metrics
+from utils.transport import session, size_cloudinary_pool
+from utils.variants import VARIANTS, eager_transformations
+from utils.errors import PermanentError, PipelineError, RateLimitError, TransientError, error_for_status
+from utils.retry import call
+
+_configured = False
+_configure_lock = threading.Lock()
+
+def configure_cloudinary():
+    """Import and configure the Cloudinary SDK on first use, not at import time"""
+    global _configured
+    if _configured:
+        return
+    with _configure_lock:
+        if _configured:
+            return
+        import cloudinary
+
+        # ✅ CONFIGURE CLOUDINARY WITH YOUR KEYS
+        cloudinary.config(
+            cloud_name=CLOUDINARY_CONFIG["cloud_name"],
+            api_key=CLOUDINARY_CONFIG["api_key"],
+            api_secret=CLOUDINARY_CONFIG["api_secret"],
+            # Override to point at a local emulator (see bench/emulator.py)
+            upload_prefix=os.environ.get("CLOUDINARY_UPLOAD_PREFIX") or None
+        )
+
+        # Concurrent uploads share pooled keep-alive connections
+        size_cloudinary_pool()
+        _configured = True
+
+# "proxy": download the image here and upload the bytes
+# "fetch": pass the URL so Cloudinary downloads it; the image never passes
+#          through this host, but the Street View URL (with its API key) is sent to Cloudinary
+UPLOAD_MODE = os.environ.get("CLOUDINARY_UPLOAD_MODE", "proxy")
+
+def _upload_error(error):
+    """errors.py type for an exception from the Cloudinary SDK"""
+    import cloudinary.exceptions as errors
+
+    message = f"Cloudinary upload failed: {error}"
+    if isinstance(error, errors.RateLimited):
+        return RateLimitError(message, "cloudinary")
+    # In fetch mode, BadRequest is what a failed server-side fetch of the image
+    # URL looks like; otherwise the request itself was rejected
+    if isinstance(error, errors.BadRequest):
+        return (TransientError if UPLOAD_MODE == "fetch" else PermanentError)(message, "cloudinary")
+    if isinstance(error, errors.GeneralError) or type(error) is errors.Error:
+        return TransientError(message, "cloudinary")
+    return PermanentError(message, "cloudinary")
+
+def _upload(file, upload_options):
+    import cloudinary.exceptions
+    import cloudinary.uploader
 
-# ✅ CONFIGURE CLOUDINARY WITH YOUR KEYS
-cloudinary.config(
-    cloud_name=CLOUDINARY_CONFIG["cloud_name"],
-    api_key=CLOUDINARY_CONFIG["api_key"],
-    api_secret=CLOUDINARY_CONFIG["api_secret"]
-)
+    limiter.acquire("cloudinary")
+    with metrics.timed("cloudinary"):
+        try:
+            return cloudinary.uploader.upload(file, **upload_options)
+        except cloudinary.exceptions.Error as e:
+            raise _upload_error(e) from e
 
-# Reuse session for better performance
-session = requests.Session()
+def download_image(image_url):
+    """Open a streamed Street View image download"""
+    limiter.acquire("static")
+    with metrics.timed("static"):
+        try:
+            response = session.get(image_url, stream=True, timeout=30)
+        except requests.RequestException as e:
+            raise TransientError(f"Failed to download image: {e}", "static") from e
+        if response.status_code != 200:
+            response.close()
+            raise error_for_status(response.status_code, f"Failed to download image: {response.status_code}", "static")
+    return response
 
 def upload_to_cloudinary(image_url, public_id=None):
-    response = session.get(image_url, stream=True, timeout=30)
-    if response.status_code != 200:
-        raise Exception(f"Failed to download image: {response.status_code}")
+    configure_cloudinary()
 
     upload_options = {"resource_type": "image"}
     if public_id:
         upload_options["public_id"] = public_id
+    if VARIANTS:
+        # Derived sizes/formats are generated from this one upload
+        upload_options["eager"] = eager_transformations()
+
+    if UPLOAD_MODE == "fetch":
+        def fetch_upload():
+            # Cloudinary's fetch still spends Street View quota
+            limiter.acquire("static")
+            return _upload(image_url, upload_options)
+
+        return call("cloudinary", fetch_upload)["secure_url"]
+
+    def download_and_upload():
+        # The download is streamed into the upload, so an upload retry downloads again
+        response = call("static", lambda: download_image(image_url))
+        try:
+            image_bytes = int(response.headers.get("Content-Length", 0))
+            metrics.inc("bytes_transferred_total", image_bytes, endpoint="static")
+            upload_result = _upload(response.raw, upload_options)
+        finally:
+            response.close()
+        metrics.inc("bytes_transferred_total", image_bytes, endpoint="cloudinary")
+        return upload_result
+
+    return call("cloudinary", download_and_upload)["secure_url"]
+
+LIST_PAGE_SIZE = 500  # Admin API maximum per call
+# A deduplicated row's image is uploaded under another row's public_id; this
+# tag on that image names the row's own public_id, so the asset index finds it
+ALIAS_TAG_PREFIX = "alias:"
+
+def alias_asset(public_id, alias):
+    """Tag the image uploaded as public_id so list_assets() also yields it as alias
+
+    Best effort: the row already has its URL, so a failure only means a
+    later recovery run processes the row again.
+    """
+    configure_cloudinary()
+    import cloudinary.exceptions
+    import cloudinary.uploader
+
+    def add_tag():
+        limiter.acquire("cloudinary")
+        with metrics.timed("cloudinary"):
+            try:
+                return cloudinary.uploader.add_tag(ALIAS_TAG_PREFIX + alias, [public_id])
+            except cloudinary.exceptions.Error as e:
+                raise _upload_error(e) from e
+
+    try:
+        call("cloudinary", add_tag)
+    except PipelineError as e:
+        print(f"    Could not record {alias} as an alias of {public_id}: {e}")
+
+def list_assets(prefix=""):
+    """Yield (public_id, secure_url) for every uploaded image under prefix, and for each alias tagged on one"""
+    configure_cloudinary()
+    import cloudinary.api
 
-    upload_result = cloudinary.uploader.upload(response.raw, **upload_options)
-    return upload_result["secure_url"]
+    cursor = None
+    while True:
+        options = {"type": "upload", "max_results": LIST_PAGE_SIZE, "tags": True}
+        if prefix:
+            options["prefix"] = prefix
+        if cursor:
+            options["next_cursor"] = cursor
+        limiter.acquire("cloudinary_admin")
+        with metrics.timed("cloudinary_admin"):
+            page = cloudinary.api.resources(**options)
+        for resource in page.get("resources", []):
+            yield resource["public_id"], resource["secure_url"]
+            for tag in resource.get("tags", []):
+                if tag.startswith(ALIAS_TAG_PREFIX):
+                    yield tag[len(ALIAS_TAG_PREFIX):], resource["secure_url"]
+        cursor = page.get("next_cursor")
+        if not cursor:
+            return
@@ -0,0 +1,87 @@
+import os
+import signal
+import threading
+import time
+
+MAX_RUNTIME = float(os.environ.get("BATCH_MAX_RUNTIME", 1800))  # Seconds per run; 0 for no limit
+DRAIN_MARGIN = float(os.environ.get("BATCH_DRAIN_MARGIN", 120))  # Stop admitting rows this long before the end
+
+
+class Deadline:
+    """Run deadline that lets a batch wind down instead of being killed
+
+    Rows are admitted until drain_margin seconds before the deadline (or
+    until stop() is called, e.g. from SIGTERM). Rows already in flight then
+    finish and their results are flushed; only work still queued when the
+    deadline itself passes is dropped, and it is picked up by the next run.
+    """
+
+    def __init__(self):
+        self.ends_at = None
+        self.drain_margin = DRAIN_MARGIN
+        self.reason = None
+        self._stopped = threading.Event()
+
+    def start(self, max_runtime=MAX_RUNTIME, drain_margin=DRAIN_MARGIN):
+        self.ends_at = time.monotonic() + max_runtime if max_runtime else None
+        self.drain_margin = min(drain_margin, max_runtime / 2) if max_runtime else drain_margin
+        return self
+
+    def remaining(self):
+        return None if self.ends_at is None else self.ends_at - time.monotonic()
+
+    def stop(self, reason):
+        if not self._stopped.is_set():
+            self.reason = reason
+            self._stopped.set()
+            print(f"{reason}: finishing rows in flight and writing results before exit")
+
+    def admitting(self):
+        """False once new rows should no longer start"""
+        if self._stopped.is_set():
+            return False
+        remaining = self.remaining()
+        if remaining is not None and remaining <= self.drain_margin:
+            self.stop("Deadline near")
+            return False
+        return True
+
+    def sleep(self, seconds):
+        """Wait up to seconds, waking early once new rows should no longer start"""
+        remaining = self.remaining()
+        if remaining is not None:
+            seconds = min(seconds, max(remaining - self.drain_margin, 0))
+        self._stopped.wait(seconds)
+
+    def expired(self):
+        remaining = self.remaining()
+        if remaining is None or remaining > 0:
+            return False
+        # Rows can run past the drain without asking for new work, e.g. while an endpoint is paused
+        if not self._stopped.is_set():
+            self.reason = "Deadline passed"
+            self._stopped.set()
+        return True
+
+    def install_signal_handlers(self):
+        """SIGINT/SIGTERM start a drain; a second Ctrl+C interrupts as usual"""
+        def handle(signum, frame):
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            self.stop(f"Received {signal.Signals(signum).name}")
+
+        signal.signal(signal.SIGINT, handle)
+        signal.signal(signal.SIGTERM, handle)
+
+
+def admit(rows_with_indices, deadline):
+    """Yield rows only while the deadline admits new work"""
+    rows = iter(rows_with_indices)
+    while deadline.admitting():
+        try:
+            yield next(rows)
+        except StopIteration:
+            return
+
+
+# Deadline of the current run; without start() it never expires
+deadline = Deadline()
@@ -0,0 +1,89 @@
+import collections
+import threading
+
+from .cloud import alias_asset
+from .gmaps import get_metadata
+from .singleflight import SingleFlight
+
+HEADING_STEP = 5  # Headings within the same 5 degree bucket share one image
+COORD_PRECISION = 6  # ~0.1m; identical geocodes share one metadata lookup
+MAX_ENTRIES = 100000  # Per table; past this the least recently used keys are forgotten
+
+
+class PanoIndex:
+    """Per-run index so each distinct metadata lookup and image is done once
+
+    Concurrent callers for the same key share one SingleFlight call, and
+    its result is remembered for the rest of the run. Failures are not
+    remembered, so a later row can retry. Each table keeps at most
+    max_entries keys, so a long watch session does not grow without bound;
+    a key forgotten this way only costs one repeated lookup or upload.
+    """
+
+    def __init__(self, heading_step=HEADING_STEP, max_entries=MAX_ENTRIES):
+        self.heading_step = heading_step
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._tables = {"metadata": collections.OrderedDict(), "images": collections.OrderedDict()}
+        self._stored = dict.fromkeys(self._tables, 0)  # Entries ever stored, for stats()
+        self._metadata_flights = SingleFlight("pano_metadata")
+        self._upload_flights = SingleFlight("upload")
+
+    def snap_heading(self, heading):
+        """Round a heading to the index's bucket size"""
+        return int(round(heading / self.heading_step) * self.heading_step) % 360
+
+    def _lookup(self, name, key):
+        """(True, result) for a remembered key, marking it recently used; (False, None) otherwise"""
+        table = self._tables[name]
+        with self._lock:
+            if key not in table:
+                return False, None
+            table.move_to_end(key)
+            return True, table[key]
+
+    def _once(self, name, flights, key, fn):
+        found, result = self._lookup(name, key)
+        if found:
+            return result
+
+        def call():
+            # A flight that finished just before this one started already stored the result
+            found, result = self._lookup(name, key)
+            if found:
+                return result
+            result = fn()
+            # Remembered before the flight ends, so no later caller repeats it
+            table = self._tables[name]
+            with self._lock:
+                table[key] = result
+                self._stored[name] += 1
+                if len(table) > self.max_entries:
+                    table.popitem(last=False)
+            return result
+
+        return flights.do(key, call)
+
+    def get_metadata(self, lat, lng):
+        key = (round(lat, COORD_PRECISION), round(lng, COORD_PRECISION))
+        return self._once("metadata", self._metadata_flights, key, lambda: get_metadata(lat, lng))
+
+    def host(self, key, public_id, upload):
+        """Return the hosted URL for an image key, calling upload() only once
+
+        upload() stores the image under public_id. Rows that share it
+        instead tag it with their own public_id, so a later run's asset
+        index finds them without geocoding them again.
+        """
+        url, owner = self._once("images", self._upload_flights, key, lambda: (upload(), public_id))
+        if owner != public_id:
+            alias_asset(owner, public_id)
+        return url
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stored)
+
+
+# Shared index for the current run
+pano_index = PanoIndex()
@@ -0,0 +1,31 @@
+class PipelineError(Exception):
+    """A row step or API call failed; endpoint names the dependency, when there is one"""
+
+    retryable = True
+
+    def __init__(self, message, endpoint=None):
+        super().__init__(message)
+        self.endpoint = endpoint
+
+
+class PermanentError(PipelineError):
+    """Retrying cannot help: no geocode or panorama for the address, or the request was refused"""
+
+    retryable = False
+
+
+class TransientError(PipelineError):
+    """Timeouts, dropped connections and 5xx responses; worth retrying after a pause"""
+
+
+class RateLimitError(TransientError):
+    """The API reports its quota is exhausted (OVER_QUERY_LIMIT, HTTP 420/429), so callers should slow down"""
+
+
+def error_for_status(status, message, endpoint):
+    """Typed error for an HTTP error response"""
+    if status in (420, 429):
+        return RateLimitError(message, endpoint)
+    if status >= 500 or status == 408:
+        return TransientError(message, endpoint)
+    return PermanentError(message, endpoint)
@@ -1,5 +1,11 @@
 import math
 
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+MORTON_BITS = 26  # Bits per axis in morton_keys (~0.3m at the equator)
+
+
 def calculate_heading(lat1, lon1, lat2, lon2):
     """Calculate the compass bearing from point A to point B"""
     d_lon = math.radians(lon2 - lon1)
@@ -14,3 +20,28 @@ def calculate_heading(lat1, lon1, lat2, lon2):
     initial_heading = math.atan2(x, y)
     heading_degrees = (math.degrees(initial_heading) + 360) % 360
     return heading_degrees
+
+
+def distance_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in meters between two points"""
+    lat1, lat2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _spread_bits(v):
+    """Put a zero bit between each of the low 32 bits of v"""
+    v = v & np.uint64(0x00000000FFFFFFFF)
+    for shift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+                        (2, 0x3333333333333333), (1, 0x5555555555555555)):
+        v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+    return v
+
+
+def morton_keys(lat, lng, bits=MORTON_BITS):
+    """Z-order keys: sorting by them keeps nearby points close together (like geohash prefixes)"""
+    scale = (1 << bits) - 1
+    y = np.round((np.asarray(lat, dtype=np.float64) + 90) / 180 * scale).astype(np.uint64)
+    x = np.round((np.asarray(lng, dtype=np.float64) + 180) / 360 * scale).astype(np.uint64)
+    return (_spread_bits(y) << np.uint64(1)) | _spread_bits(x)
@@ -0,0 +1,123 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# On-disk geocode cache shared by every batch run
+CACHE_PATH = os.environ.get("GEOCODE_CACHE_PATH", "geocode_cache.sqlite")
+MISS_TTL = 7 * 24 * 3600  # Re-check ZERO_RESULTS addresses after a week
+MAX_ENTRIES = 200000
+EVICT_CHECK_INTERVAL = 1000  # Check the size limit every N writes
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize_address(address):
+    """Normalize an address string into a stable cache key"""
+    return _NON_WORD.sub(" ", str(address).lower()).strip()
+
+
+class GeocodeCache:
+    """Thread-safe SQLite cache of geocode hits and misses"""
+
+    def __init__(self, path=CACHE_PATH, miss_ttl=MISS_TTL, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.miss_ttl = miss_ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = None
+        self._writes = 0
+
+    def _connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS geocode ("
+                " key TEXT PRIMARY KEY,"
+                " lat REAL,"
+                " lng REAL,"
+                " created REAL NOT NULL,"
+                " accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS geocode_accessed ON geocode (accessed)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, address):
+        """Return (lat, lng) for a hit, (None, None) for a cached miss, or None if unknown"""
+        key = normalize_address(address)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT lat, lng, created FROM geocode WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            lat, lng, created = row
+            if lat is None and now - created > self.miss_ttl:
+                conn.execute("DELETE FROM geocode WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            conn.execute("UPDATE geocode SET accessed = ? WHERE key = ?", (now, key))
+            conn.commit()
+            return lat, lng
+
+    def peek(self, address):
+        """get() without side effects: no access time update, and expired misses are not deleted
+
+        For planning and ordering, which look at many rows they may never geocode.
+        """
+        key = normalize_address(address)
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT lat, lng, created FROM geocode WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        lat, lng, created = row
+        if lat is None and time.time() - created > self.miss_ttl:
+            return None
+        return lat, lng
+
+    def put(self, address, lat, lng):
+        """Store a geocode result; pass lat=lng=None to record a miss"""
+        key = normalize_address(address)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO geocode (key, lat, lng, created, accessed)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, lat, lng, now, now),
+            )
+            conn.commit()
+            self._writes += 1
+            if self._writes % EVICT_CHECK_INTERVAL == 0:
+                self._evict(conn)
+
+    def _evict(self, conn):
+        """Drop the least recently used entries beyond max_entries"""
+        (count,) = conn.execute("SELECT COUNT(*) FROM geocode").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM geocode WHERE key IN ("
+                " SELECT key FROM geocode ORDER BY accessed LIMIT ?)",
+                (excess,),
+            )
+            conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# Module-level cache used by utils.gmaps
+geocode_cache = GeocodeCache()
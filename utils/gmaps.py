@@ -1,62 +1,102 @@
+import os
+
 import requests
-import time
-from math import atan2, degrees
+
 from .keys import GOOGLE_API_KEY
+from .geocache import geocode_cache, normalize_address
+from .ratelimit import limiter
+from .metrics import metrics
+from .transport import session
+from .singleflight import SingleFlight
+from .offline_geocoder import offline_geocoder
+from .errors import PermanentError, RateLimitError, TransientError, error_for_status
+from .retry import call
 
-# Reuse session for better performance
-session = requests.Session()
+# Override to point at a local emulator (see bench/emulator.py)
+GOOGLE_MAPS_BASE_URL = os.environ.get("GOOGLE_MAPS_BASE_URL", "https://maps.googleapis.com")
+GEOCODE_URL = f"{GOOGLE_MAPS_BASE_URL}/maps/api/geocode/json"
+METADATA_URL = f"{GOOGLE_MAPS_BASE_URL}/maps/api/streetview/metadata"
 
-# Rate limiting
-last_api_call = 0
-MIN_API_INTERVAL = 0.02  # 50 QPS limit = 20ms between calls
+# Identical requests already in flight are shared instead of sent again
+geocode_flights = SingleFlight("geocode")
+metadata_flights = SingleFlight("metadata")
 
-def rate_limit():
-    """Enforce rate limiting between API calls"""
-    global last_api_call
-    current_time = time.time()
-    elapsed = current_time - last_api_call
-    if elapsed < MIN_API_INTERVAL:
-        time.sleep(MIN_API_INTERVAL - elapsed)
-    last_api_call = time.time()
+def rate_limit(endpoint):
+    """Wait for the endpoint's token bucket (shared across threads and processes)"""
+    return limiter.acquire(endpoint)
 
 def get_geocode(address):
-    rate_limit()
-    url = f"https://maps.googleapis.com/maps/api/geocode/json?address={address}&key={GOOGLE_API_KEY}"
-    res = session.get(url, timeout=30)
-    res.raise_for_status()
-    data = res.json()
-    
-    # Handle rate limiting responses
-    if data.get('status') == 'OVER_QUERY_LIMIT':
-        raise Exception("Google Maps API rate limit exceeded")
+    # Serve repeated addresses (hits and known misses) from the on-disk cache
+    cached = geocode_cache.get(address)
+    if cached is not None:
+        metrics.inc("geocode_cache_hits_total")
+        return cached
+    # Then the local address-point index, when one has been built
+    located = offline_geocoder.lookup(address)
+    if located is not None:
+        metrics.inc("offline_geocode_hits_total")
+        return located
+    return geocode_flights.do(normalize_address(address), lambda: call("geocode", lambda: fetch_geocode(address)))
+
+
+def _get_json(endpoint, url):
+    """GET a Maps API URL, raising errors.py types for failures"""
+    with metrics.timed(endpoint):
+        try:
+            res = session.get(url, timeout=30)
+        except requests.RequestException as e:
+            raise TransientError(f"{endpoint} request failed: {e}", endpoint) from e
+        if res.status_code != 200:
+            raise error_for_status(res.status_code, f"{endpoint} request returned HTTP {res.status_code}", endpoint)
+        metrics.inc("bytes_transferred_total", len(res.content), endpoint=endpoint)
+        return res.json()
+
+
+def fetch_geocode(address):
+    rate_limit("geocode")
+    url = f"{GEOCODE_URL}?address={address}&key={GOOGLE_API_KEY}"
+    return parse_geocode(address, _get_json("geocode", url))
+
+
+def check_status(endpoint, data):
+    """Raise for Maps API statuses that are failures rather than answers"""
+    status = data.get("status")
+    if status == "OVER_QUERY_LIMIT":
+        raise RateLimitError("Google Maps API rate limit exceeded", endpoint)
+    if status == "UNKNOWN_ERROR":
+        raise TransientError(f"Google Maps API server error ({endpoint})", endpoint)
+    if status in ("REQUEST_DENIED", "INVALID_REQUEST"):
+        raise PermanentError(f"Google Maps API {status}: {data.get('error_message', '')}".rstrip(": "), endpoint)
+
+
+def parse_geocode(address, data):
+    """Turn a Geocoding API response into (lat, lng), caching the outcome"""
+    check_status("geocode", data)
     
     if data['status'] != 'OK' or not data['results']:
+        # Only cache definitive misses
+        if data['status'] in ('OK', 'ZERO_RESULTS'):
+            geocode_cache.put(address, None, None)
         return None, None
     location = data['results'][0]['geometry']['location']
+    geocode_cache.put(address, location['lat'], location['lng'])
     return location['lat'], location['lng']
 
 
 def get_metadata(lat, lng):
-    rate_limit()
-    url = f"https://maps.googleapis.com/maps/api/streetview/metadata?location={lat},{lng}&key={GOOGLE_API_KEY}"
-    res = session.get(url, timeout=30)
-    res.raise_for_status()
-    data = res.json()
-    
-    # Handle rate limiting responses
-    if data.get('status') == 'OVER_QUERY_LIMIT':
-        raise Exception("Google Maps API rate limit exceeded")
+    return metadata_flights.do((lat, lng), lambda: call("metadata", lambda: fetch_metadata(lat, lng)))
+
+
+def fetch_metadata(lat, lng):
+    rate_limit("metadata")
+    url = f"{METADATA_URL}?location={lat},{lng}&key={GOOGLE_API_KEY}"
+    return parse_metadata(_get_json("metadata", url))
+
+
+def parse_metadata(data):
+    """Turn a Street View metadata response into (pano_lat, pano_lng, pano_id)"""
+    check_status("metadata", data)
     
     if data['status'] != 'OK' or 'pano_id' not in data:
         return None, None, None
     return data['location']['lat'], data['location']['lng'], data['pano_id']
-
-
-def calculate_heading(lat1, lon1, lat2, lon2):
-    delta_lon = lon2 - lon1
-    x = atan2(
-        degrees(delta_lon),
-        degrees(lat2 - lat1)
-    )
-    heading = (degrees(x) + 360) % 360
-    return round(heading)
@@ -0,0 +1,138 @@
+import json
+import os
+import threading
+
+JOURNAL_PATH = "batch_journal.jsonl"
+JOURNAL_FSYNC = False  # True survives power loss too, at a few ms per row
+
+
+class Journal:
+    """Append-only per-row log of results, for resuming after a crash
+
+    Every finished row is appended as a "result" line keyed by sheet row
+    index and address before it is queued for the sheet, and a "flushed"
+    line follows once the sheet write succeeds. On restart, rows journaled
+    as successful are skipped, rows whose last result was an error are
+    processed again (once per run), and results that never reached the
+    sheet are replayed. Only results not yet written are kept in memory,
+    so a long run does not grow with every row.
+    """
+
+    def __init__(self, path=JOURNAL_PATH, fsync=JOURNAL_FSYNC):
+        self.path = path
+        self.fsync = fsync
+        self.results = {}  # row index -> (address, url, status), until written
+        self.addresses = {}  # row index -> address of the rows in this run, until written successfully
+        self.failed = {}  # row index -> address, for rows that failed in this run
+        self._lock = threading.Lock()
+        self._file = None
+
+    def load(self):
+        """Read an existing journal; a torn final line from a crash is ignored"""
+        flushed = set()
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if entry["type"] == "result":
+                        self.results[entry["row"]] = (entry["address"], entry["url"], entry["status"])
+                        flushed.discard(entry["row"])
+                    elif entry["type"] == "flushed":
+                        flushed.update(entry["rows"])
+        except FileNotFoundError:
+            pass
+        # Written results are on the sheet (or in the results file), which already marks those rows done
+        for index in flushed:
+            self.results.pop(index, None)
+        return self
+
+    def track(self, rows_with_indices, build_address):
+        """Remember the address of each row so results can be keyed on it"""
+        for index, row in rows_with_indices:
+            self.addresses[index] = build_address(row)
+
+    def is_done(self, index, address):
+        """True when the row already succeeded for this address, or already failed in this run"""
+        if self.failed.get(index) == address:
+            return True
+        entry = self.results.get(index)
+        return entry is not None and entry[0] == address and entry[2] == "Success"
+
+    def unflushed(self):
+        """(index, url, status) for journaled results whose row still holds the same address"""
+        return [
+            (index, url, status)
+            for index, (address, url, status) in sorted(self.results.items())
+            if self.addresses.get(index) == address
+        ]
+
+    def _append(self, entries):
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+                # Terminate a line torn by a crash so new entries parse
+                if self._file.tell() > 0:
+                    with open(self.path, "rb") as f:
+                        f.seek(-1, os.SEEK_END)
+                        if f.read(1) != b"\n":
+                            self._file.write("\n")
+            for entry in entries:
+                self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+    def record(self, results):
+        entries = []
+        for index, url, status in results:
+            address = self.addresses.get(index, "")
+            self.results[index] = (address, url, status)
+            if status == "Success":
+                self.failed.pop(index, None)
+            else:
+                self.failed[index] = address
+            entries.append({"type": "result", "row": index, "address": address, "url": url, "status": status})
+        self._append(entries)
+
+    def mark_flushed(self, results):
+        indices = [result[0] for result in results]
+        self._append([{"type": "flushed", "rows": indices}])
+        for index, url, status in results:
+            # A newer result for the row (its address changed) stays until it is written too
+            if self.results.get(index, (None,))[1:] == (url, status):
+                del self.results[index]
+                # A replayed error is retried later in the run and journaled under this address again
+                if status == "Success":
+                    self.addresses.pop(index, None)
+
+    def pending_count(self):
+        return len(self.results)
+
+    def compact(self):
+        """Start a new file once every result is written, so a long session's journal stays small"""
+        with self._lock:
+            if self.results:
+                return False
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            return True
+
+    def close(self, remove=False):
+        """Close the file; remove it once every result is safely on the sheet"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        if remove:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,192 @@
+import calendar
+import os
+import re
+import socket
+import time
+import zlib
+
+from .ratelimit import limiter
+from .metrics import metrics
+from .sheets import contiguous_runs, get_cached_column_layout, read_ranges
+
+LEASE_SIZE = 500  # Rows claimed per lease
+LEASE_TTL = 1800  # Seconds before another runner may reclaim an unfinished lease
+LEASE_SETTLE = 3  # Seconds to wait before checking that a claim was not overwritten
+LEASE_CHECK_ROWS = 100  # Rows processed between re-checks (and renewals) of a block's lease
+LEASE_PATTERN = re.compile(r"^Leased by (\S+) until (\d{4}-\d\d-\d\dT\d\d:\d\d:\d\dZ)$")
+
+
+def default_owner():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def format_lease(owner, expires):
+    return f"Leased by {owner} until {time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(expires))}"
+
+
+def parse_lease(status):
+    """(owner, expiry epoch) for a lease marker, or None for any other status"""
+    match = LEASE_PATTERN.match(status or "")
+    if not match:
+        return None
+    return match.group(1), calendar.timegm(time.strptime(match.group(2), "%Y-%m-%dT%H:%M:%SZ"))
+
+
+def is_claimable(status, owner, now=None):
+    """True unless the row is under another runner's unexpired lease"""
+    lease = parse_lease(status)
+    if lease is None:
+        return True
+    lease_owner, expires = lease
+    return lease_owner == owner or expires <= (now or time.time())
+
+
+def _status_ranges(sheet, indices):
+    """A1 ranges of the status column covering indices, one per contiguous run"""
+    from gspread.utils import rowcol_to_a1 as to_a1
+
+    column = get_cached_column_layout(sheet)["Processing Status"]
+    runs = contiguous_runs(indices)
+    # +2 for 0-indexing and header
+    return [(run, f"{to_a1(run[0] + 2, column)}:{to_a1(run[-1] + 2, column)}") for run in runs]
+
+
+def _statuses(ranges, columns):
+    """(row index, status) for each row of ranges, from batch_get's values"""
+    for (run, _), values in zip(ranges, columns):
+        for offset, index in enumerate(run):
+            cell = values[offset] if offset < len(values) and values[offset] else [""]
+            yield index, cell[0]
+
+
+class LeaseManager:
+    """Claims blocks of rows for one runner through the Processing Status column
+
+    A claim writes "Leased by <owner> until <UTC time>" into each free row,
+    waits LEASE_SETTLE seconds and reads the column back; rows where a
+    concurrent runner's marker won are dropped. Finished rows are
+    overwritten with their result, and leases left by a runner that died
+    expire after LEASE_TTL so others pick the rows up. Rows another runner
+    finished during this run are left alone even when the result was an
+    error, so failed rows are retried by the next run rather than by every
+    runner in turn.
+
+    The sheet has no compare-and-set, so this is a best-effort heuristic:
+    a runner that reads before our write and writes after our check still
+    believes it owns the rows. refresh() narrows that window by re-reading
+    the markers before each chunk of a block, and renews the lease once it
+    is half spent so a slow block does not become claimable mid-run. A row
+    can still be processed twice; it is never lost.
+    """
+
+    def __init__(self, sheet, owner=None, lease_size=LEASE_SIZE, ttl=LEASE_TTL, settle=LEASE_SETTLE):
+        self.sheet = sheet
+        self.owner = owner or default_owner()
+        self.lease_size = lease_size
+        self.ttl = ttl
+        self.settle = settle
+        self._expires = 0.0  # When the markers this runner last wrote expire
+        self._first_seen = None  # row index -> status when this runner started
+
+    def available(self, rows_with_indices):
+        """The rows this runner may still claim"""
+        now = time.time()
+        if self._first_seen is None:
+            self._first_seen = {index: row.get("Processing Status") for index, row in rows_with_indices}
+
+        rows = []
+        for index, row in rows_with_indices:
+            status = row.get("Processing Status")
+            finished_elsewhere = status != self._first_seen.get(index, status) and parse_lease(status) is None
+            if not finished_elsewhere and is_claimable(status, self.owner, now):
+                rows.append((index, row))
+        return rows
+
+    def claim(self, rows_with_indices):
+        """Lease up to lease_size of the given rows; returns the rows now owned"""
+        candidates = self.available(rows_with_indices)
+        if not candidates:
+            return []
+        # Runners start at different points of the backlog so their first claims rarely collide
+        start = zlib.crc32(self.owner.encode()) % len(candidates)
+        candidates = (candidates[start:] + candidates[:start])[:self.lease_size]
+
+        expires = time.time() + self.ttl
+        marker = format_lease(self.owner, expires)
+        ranges = _status_ranges(self.sheet, [index for index, _ in candidates])
+        try:
+            self._write(ranges, marker)
+            self._expires = expires
+
+            # Last writer wins: keep only the rows still carrying our marker
+            time.sleep(self.settle)
+            columns = read_ranges(self.sheet, [a1 for _, a1 in ranges])
+        except Exception as e:
+            # Nothing is owned until verified; the caller asks again
+            print(f"  Lease claim failed, retrying: {e}")
+            time.sleep(self.settle)
+            return []
+
+        owned = {index for index, status in _statuses(ranges, columns) if status == marker}
+        claimed = [(index, row) for index, row in candidates if index in owned]
+        metrics.inc("rows_leased_total", len(claimed))
+        if len(claimed) < len(candidates):
+            print(f"  Lost {len(candidates) - len(claimed)} rows to another runner")
+        return claimed
+
+    def refresh(self, rows_with_indices):
+        """The rows still leased to this runner, renewing the lease once it is half spent
+
+        Called with the unstarted rest of a block before each chunk, so rows
+        another runner took over are dropped before they are processed twice.
+        """
+        if not rows_with_indices:
+            return []
+        ranges = _status_ranges(self.sheet, [index for index, _ in rows_with_indices])
+        try:
+            columns = read_ranges(self.sheet, [a1 for _, a1 in ranges])
+        except Exception as e:
+            # Keep working on the block; the next check may succeed
+            print(f"  Lease check failed, keeping the block: {e}")
+            return rows_with_indices
+
+        owned = set()
+        for index, status in _statuses(ranges, columns):
+            lease = parse_lease(status)
+            if lease is not None and lease[0] == self.owner:
+                owned.add(index)
+        kept = [(index, row) for index, row in rows_with_indices if index in owned]
+        if len(kept) < len(rows_with_indices):
+            print(f"  Lost {len(rows_with_indices) - len(kept)} leased rows to another runner")
+
+        if kept and time.time() > self._expires - self.ttl / 2:
+            expires = time.time() + self.ttl
+            try:
+                self._write(_status_ranges(self.sheet, [index for index, _ in kept]), format_lease(self.owner, expires))
+                self._expires = expires
+                metrics.inc("leases_renewed_total")
+            except Exception as e:
+                print(f"  Lease renewal failed, retrying at the next check: {e}")
+        return kept
+
+    def reload_statuses(self, rows_with_indices):
+        """Re-read the Processing Status of rows_with_indices in place and return them
+
+        Between blocks only the markers and results other runners wrote can
+        have changed, so one read of the status column stands in for
+        re-reading every column of the sheet.
+        """
+        if not rows_with_indices:
+            return rows_with_indices
+        indices = [index for index, _ in rows_with_indices]
+        # One range spanning the rows, even where others finished rows in between
+        ranges = _status_ranges(self.sheet, range(min(indices), max(indices) + 1))
+        statuses = dict(_statuses(ranges, read_ranges(self.sheet, [a1 for _, a1 in ranges])))
+        for index, row in rows_with_indices:
+            row.status = statuses.get(index, "")
+        return rows_with_indices
+
+    def _write(self, ranges, marker):
+        limiter.acquire("sheets_write")
+        with metrics.timed("sheets_write"):
+            self.sheet.batch_update([{"range": a1, "values": [[marker]] * len(run)} for run, a1 in ranges])
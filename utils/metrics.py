@@ -0,0 +1,245 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from .tracing import tracer
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+EXPORT_INTERVAL = 15  # Seconds between periodic metric file writes
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "total")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                break
+        else:
+            i = len(LATENCY_BUCKETS)
+        self.counts[i] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket that holds it"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else float("inf")
+        return float("inf")
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class Metrics:
+    """Thread-safe counters, gauges and latency histograms for one run
+
+    Exported as JSON and Prometheus text, periodically by a background
+    thread and once more as an end-of-run report.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._gauge_callbacks = {}
+        self._histograms = {}
+        self.started = time.time()
+        self._exporter = None
+        self._stop = threading.Event()
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[_key(name, labels)] = value
+
+    def register_gauge(self, name, callback, **labels):
+        """Sample callback() for this gauge whenever metrics are exported"""
+        with self._lock:
+            self._gauge_callbacks[_key(name, labels)] = callback
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timed(self, endpoint):
+        """Count a call to endpoint, its latency, and whether it raised"""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc("api_errors_total", endpoint=endpoint)
+            raise
+        finally:
+            end = time.perf_counter()
+            self.inc("api_calls_total", endpoint=endpoint)
+            self.observe("api_latency_seconds", end - start, endpoint=endpoint)
+            tracer.record(endpoint, start, end, cat="api")
+
+    def snapshot(self):
+        with self._lock:
+            callbacks = list(self._gauge_callbacks.items())
+        sampled = {}
+        for key, callback in callbacks:
+            try:
+                sampled[key] = callback()
+            except Exception:
+                pass
+
+        with self._lock:
+            gauges = dict(self._gauges)
+            gauges.update(sampled)
+            return {
+                "elapsed_seconds": round(time.time() - self.started, 3),
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self._counters.items())
+                ],
+                "gauges": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(gauges.items())
+                ],
+                "histograms": [
+                    {
+                        "name": name,
+                        "labels": dict(labels),
+                        "count": h.count,
+                        "sum": round(h.total, 6),
+                        "buckets": list(h.counts),
+                        "p50": h.quantile(0.5),
+                        "p99": h.quantile(0.99),
+                    }
+                    for (name, labels), h in sorted(self._histograms.items())
+                ],
+            }
+
+    def to_prometheus(self, snapshot=None):
+        snapshot = snapshot or self.snapshot()
+        lines = []
+        for entries in (snapshot["counters"], snapshot["gauges"]):
+            for entry in entries:
+                labels = _label_text(sorted(entry["labels"].items()))
+                lines.append(f"streetview_{entry['name']}{labels} {entry['value']}")
+        for entry in snapshot["histograms"]:
+            name = f"streetview_{entry['name']}"
+            labels = sorted(entry["labels"].items())
+            cumulative = 0
+            for bound, n in zip(list(LATENCY_BUCKETS) + ["+Inf"], entry["buckets"]):
+                cumulative += n
+                lines.append(f"{name}_bucket{_label_text(labels + [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{_label_text(labels)} {entry['sum']}")
+            lines.append(f"{name}_count{_label_text(labels)} {entry['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Write <path>.json and <path>.prom atomically"""
+        snapshot = self.snapshot()
+        for suffix, text in ((".json", json.dumps(snapshot, indent=2)), (".prom", self.to_prometheus(snapshot))):
+            tmp = f"{path}{suffix}.tmp"
+            with open(tmp, "w") as f:
+                f.write(text)
+            os.replace(tmp, path + suffix)
+
+    def start_exporter(self, path, interval=EXPORT_INTERVAL):
+        """Write the metric files every interval seconds until stop_exporter()"""
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.write(path)
+                except OSError as e:
+                    print(f"  Could not write metrics: {e}")
+
+        self._exporter = threading.Thread(target=run, name="metrics-exporter", daemon=True)
+        self._exporter.start()
+
+    def stop_exporter(self, path=None):
+        self._stop.set()
+        if path:
+            self.write(path)
+
+    def value(self, name, **labels):
+        with self._lock:
+            return self._counters.get(_key(name, labels), 0)
+
+    def report(self):
+        """Human-readable end-of-run summary"""
+        snapshot = self.snapshot()
+        counters = {(c["name"], tuple(sorted(c["labels"].items()))): c["value"] for c in snapshot["counters"]}
+
+        def counter(name, **labels):
+            return counters.get(_key(name, labels), 0)
+
+        lines = ["", "--- RUN METRICS ---"]
+        lines.append(f"{'endpoint':<14}{'calls':>8}{'errors':>8}{'mean s':>9}{'p50 s':>8}{'p99 s':>8}"
+                     f"{'limit wait s':>14}{'MB':>8}")
+        for h in snapshot["histograms"]:
+            if h["name"] != "api_latency_seconds":
+                continue
+            endpoint = h["labels"]["endpoint"]
+            mean = h["sum"] / h["count"] if h["count"] else 0.0
+            megabytes = counter("bytes_transferred_total", endpoint=endpoint) / 1e6
+            lines.append(
+                f"{endpoint:<14}{h['count']:>8}{counter('api_errors_total', endpoint=endpoint):>8}"
+                f"{mean:>9.3f}{h['p50']:>8}{h['p99']:>8}"
+                f"{counter('rate_limit_wait_seconds_total', endpoint=endpoint):>14.1f}{megabytes:>8.1f}"
+            )
+
+        succeeded = counter("rows_completed_total", outcome="success")
+        failed = counter("rows_completed_total", outcome="error")
+        elapsed = snapshot["elapsed_seconds"]
+        lines.append(f"Rows: {succeeded} succeeded, {failed} failed in {elapsed:.1f}s "
+                     f"({(succeeded + failed) / elapsed if elapsed else 0:.2f} rows/sec)")
+        retries = sum(c["value"] for c in snapshot["counters"] if c["name"] == "retries_total")
+        if retries:
+            lines.append(f"Retries: {retries}")
+        skipped = sum(c["value"] for c in snapshot["counters"] if c["name"] == "retry_budget_exhausted_total")
+        if skipped:
+            lines.append(f"Retries skipped because the retry budget was spent: {skipped}")
+        trips = [f"{c['labels']['endpoint']} x{c['value']}" for c in snapshot["counters"]
+                 if c["name"] == "breaker_opened_total"]
+        if trips:
+            lines.append(f"Circuit breakers opened: {', '.join(trips)}")
+        shared = sum(c["value"] for c in snapshot["counters"] if c["name"] == "singleflight_shared_total")
+        if shared:
+            lines.append(f"Requests shared with an identical one in flight: {shared}")
+        cache_hits = counter("geocode_cache_hits_total")
+        if cache_hits:
+            lines.append(f"Geocode cache hits: {cache_hits}")
+        offline_hits = counter("offline_geocode_hits_total")
+        if offline_hits:
+            lines.append(f"Geocodes answered by the offline address index: {offline_hits}")
+        return "\n".join(lines)
+
+
+# Process-wide metrics registry
+metrics = Metrics()
@@ -0,0 +1,155 @@
+import csv
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+from .geocache import normalize_address
+
+# Address-point index built by build_address_index.py; used when the file exists
+INDEX_PATH = os.environ.get("ADDRESS_INDEX_PATH", "address_points.npy")
+BUILD_CHUNK_ROWS = 1_000_000  # Source rows hashed per numpy chunk while building
+
+# 64-bit key hash plus float32 coordinates (~0.5m) per entry, sorted by key
+INDEX_DTYPE = np.dtype([("key", "<u8"), ("lat", "<f4"), ("lng", "<f4")])
+
+# Street words spelled out in some datasets and abbreviated in others
+ABBREVIATIONS = {
+    "street": "st", "avenue": "ave", "road": "rd", "drive": "dr", "boulevard": "blvd",
+    "lane": "ln", "court": "ct", "place": "pl", "terrace": "ter", "parkway": "pkwy",
+    "highway": "hwy", "circle": "cir", "square": "sq", "trail": "trl",
+    "north": "n", "south": "s", "east": "e", "west": "w",
+    "northeast": "ne", "northwest": "nw", "southeast": "se", "southwest": "sw",
+}
+
+
+def normalize_street(street):
+    return " ".join(ABBREVIATIONS.get(word, word) for word in normalize_address(street).split())
+
+
+def address_keys(street, city, state, zip_code):
+    """Lookup keys for one address: street + zip, and street + city + state"""
+    street = normalize_street(street)
+    if not street:
+        return []
+    keys = []
+    zip_code = normalize_address(zip_code)[:5]
+    if zip_code:
+        keys.append(f"{street}|{zip_code}")
+    city, state = normalize_address(city), normalize_address(state)
+    if city and state:
+        keys.append(f"{street}|{city}|{state}")
+    return keys
+
+
+def hash_key(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little")
+
+
+def split_address(address):
+    """Undo build_address: "street, city, state zip" -> (street, city, state, zip)"""
+    parts = [part.strip() for part in str(address).rsplit(",", 2)]
+    if len(parts) != 3:
+        return None
+    street, city, state_zip = parts
+    state, _, zip_code = state_zip.partition(" ")
+    return street, city, state, zip_code
+
+
+def read_openaddresses(path):
+    """Yield (street, city, state, zip, lat, lng) from an OpenAddresses CSV"""
+    with open(path, newline="", encoding="utf-8") as f:
+        for record in csv.DictReader(f):
+            try:
+                lat, lng = float(record["LAT"]), float(record["LON"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            street = f"{record.get('NUMBER') or ''} {record.get('STREET') or ''}"
+            yield street, record.get("CITY") or "", record.get("REGION") or "", record.get("POSTCODE") or "", lat, lng
+
+
+def _chunk(entries):
+    chunk = np.empty(len(entries), dtype=INDEX_DTYPE)
+    chunk["key"] = [entry[0] for entry in entries]
+    chunk["lat"] = [entry[1] for entry in entries]
+    chunk["lng"] = [entry[2] for entry in entries]
+    return chunk
+
+
+def build_index(points, path=INDEX_PATH):
+    """Write a sorted index from (street, city, state, zip, lat, lng) tuples; returns its entry count
+
+    When an address appears more than once (units, duplicate sources) the
+    first point wins.
+    """
+    chunks = []
+    entries = []
+    for street, city, state, zip_code, lat, lng in points:
+        for key in address_keys(street, city, state, zip_code):
+            entries.append((hash_key(key), lat, lng))
+        if len(entries) >= BUILD_CHUNK_ROWS:
+            chunks.append(_chunk(entries))
+            entries = []
+    if entries:
+        chunks.append(_chunk(entries))
+
+    index = np.concatenate(chunks) if chunks else np.empty(0, dtype=INDEX_DTYPE)
+    index = index[np.argsort(index["key"], kind="stable")]
+    _, first = np.unique(index["key"], return_index=True)
+    index = index[first]
+
+    tmp = path + ".tmp.npy"
+    np.save(tmp, index)
+    os.replace(tmp, path)
+    return len(index)
+
+
+class OfflineGeocoder:
+    """Memory-mapped address-point index answering geocodes without the network
+
+    Lookups binary-search the sorted key column, so only a few pages of
+    the file are touched per address and the OS page cache keeps hot
+    areas resident across runs and processes.
+    """
+
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        self._index = None
+        self._keys = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._index is not None:
+            return self._index
+        with self._lock:
+            if self._index is None:
+                if os.path.exists(self.path):
+                    index = np.load(self.path, mmap_mode="r")
+                else:
+                    index = np.empty(0, dtype=INDEX_DTYPE)
+                self._keys = index["key"]
+                self._index = index
+        return self._index
+
+    def __len__(self):
+        return len(self._load())
+
+    def lookup(self, address):
+        """(lat, lng) for a build_address() string, or None when the index has no match"""
+        index = self._load()
+        if not len(index):
+            return None
+        parts = split_address(address)
+        if parts is None:
+            return None
+        for key in address_keys(*parts):
+            h = np.uint64(hash_key(key))
+            i = int(np.searchsorted(self._keys, h))
+            if i < len(index) and self._keys[i] == h:
+                return float(index["lat"][i]), float(index["lng"][i])
+        return None
+
+
+# Shared by every geocode path; an absent index file just means every lookup misses
+offline_geocoder = OfflineGeocoder()
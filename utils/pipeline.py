@@ -0,0 +1,113 @@
+import os
+
+import numpy as np
+
+from .gmaps import GOOGLE_MAPS_BASE_URL, get_geocode
+from .geo import calculate_heading, distance_m, morton_keys
+from .geocache import geocode_cache
+from .offline_geocoder import offline_geocoder
+from .cloud import upload_to_cloudinary
+from .keys import GOOGLE_API_KEY
+from .dedupe import pano_index
+from .assets import asset_index
+from .tracing import tracer
+from .errors import PermanentError
+
+# Cloudinary folder for uploaded images; also the prefix listed into the asset index
+ASSET_FOLDER = os.environ.get("CLOUDINARY_FOLDER", "").strip("/")
+
+# Street View Static API image parameters
+STREETVIEW_IMAGE_URL = f"{GOOGLE_MAPS_BASE_URL}/maps/api/streetview"
+IMAGE_SIZE = "560x430"
+IMAGE_PITCH = 10
+IMAGE_FOV = 70
+IMAGE_PARAMS = (IMAGE_SIZE, IMAGE_PITCH, IMAGE_FOV)
+# Meters; a panorama farther from the address mostly shows a neighbouring building. 0 accepts any distance
+MAX_PANO_DISTANCE = float(os.environ.get("MAX_PANO_DISTANCE", 40))
+
+def build_address(row):
+    return f"{row['address']}, {row['city']}, {row['state']} {row['zip_code']}"
+
+
+def build_public_id(row):
+    """Build the deterministic Cloudinary public_id for a row"""
+    street = row['address'].replace(",", "").replace(".", "").strip().replace(" ", "_")
+    city = row['city'].replace(",", "").replace(".", "").strip().replace(" ", "_")
+    zip_code = str(row['zip_code']).strip()
+    public_id = f"{street}_{city}_{zip_code}".lower()
+    return f"{ASSET_FOLDER}/{public_id}" if ASSET_FOLDER else public_id
+
+
+def build_image_url(pano_id, heading):
+    return (
+        f"{STREETVIEW_IMAGE_URL}?"
+        f"size={IMAGE_SIZE}&pano={pano_id}&heading={heading}"
+        f"&pitch={IMAGE_PITCH}&fov={IMAGE_FOV}"
+        f"&key={GOOGLE_API_KEY}"
+    )
+
+
+def pano_heading(pano_lat, pano_lng, target_lat, target_lng):
+    """Snapped bearing from the panorama to the address; rejects panoramas too far away"""
+    with tracer.span("heading"):
+        distance = distance_m(pano_lat, pano_lng, target_lat, target_lng)
+        if MAX_PANO_DISTANCE and distance > MAX_PANO_DISTANCE:
+            raise PermanentError(f"Street View panorama {distance:.0f}m too far from address")
+        return pano_index.snap_heading(calculate_heading(pano_lat, pano_lng, target_lat, target_lng))
+
+
+def order_rows_spatially(rows_with_indices):
+    """Order rows so neighbouring addresses are processed together
+
+    Rows whose geocode is already known (cached, or in the offline address
+    index) are sorted along a Z-order curve, so rows sharing a panorama run
+    back to back and reuse its metadata and upload. Rows not yet geocoded
+    follow in sheet order.
+    """
+    rows_with_indices = list(rows_with_indices)
+    coords = [
+        geocode_cache.peek(build_address(row)) or offline_geocoder.lookup(build_address(row)) or (None, None)
+        for _, row in rows_with_indices
+    ]
+    known = [i for i, (lat, lng) in enumerate(coords) if lat is not None and lng is not None]
+    if not known:
+        return rows_with_indices
+    lats = np.array([coords[i][0] for i in known])
+    lngs = np.array([coords[i][1] for i in known])
+    ordered = [known[i] for i in np.argsort(morton_keys(lats, lngs), kind="stable")]
+    unknown = sorted(set(range(len(rows_with_indices))) - set(known))
+    return [rows_with_indices[i] for i in ordered + unknown]
+
+
+def load_existing_assets():
+    """Index images already on Cloudinary so their rows skip every API call"""
+    count = asset_index.load(f"{ASSET_FOLDER}/" if ASSET_FOLDER else "")
+    print(f"Found {count} images already on Cloudinary")
+    return count
+
+
+def process_address(row):
+    """Resolve a row to a hosted Street View image URL"""
+    # Already uploaded by an earlier run
+    hosted_url = asset_index.get(build_public_id(row))
+    if hosted_url:
+        return hosted_url
+
+    target_lat, target_lng = get_geocode(build_address(row))
+    if not target_lat or not target_lng:
+        raise PermanentError("Geocoding failed")
+
+    pano_lat, pano_lng, pano_id = pano_index.get_metadata(target_lat, target_lng)
+    if not pano_id or None in [pano_lat, pano_lng]:
+        raise PermanentError("Street View metadata not available")
+
+    heading = pano_heading(pano_lat, pano_lng, target_lat, target_lng)
+    image_url = build_image_url(pano_id, heading)
+    public_id = build_public_id(row)
+
+    # Rows resolving to the same image share one fetch and upload
+    return pano_index.host(
+        (pano_id, heading, IMAGE_PARAMS), public_id,
+        lambda: upload_to_cloudinary(image_url, public_id=public_id),
+    )
+
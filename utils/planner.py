@@ -0,0 +1,108 @@
+import math
+
+from .assets import asset_index
+from .cloud import LIST_PAGE_SIZE, UPLOAD_MODE
+from .dedupe import COORD_PRECISION
+from .geocache import geocode_cache, normalize_address
+from .offline_geocoder import offline_geocoder
+from .pipeline import build_address, build_public_id
+from .ratelimit import ENDPOINTS, limiter
+from .writer import FLUSH_ROWS
+
+# Google list prices in USD per 1,000 billable requests, before volume
+# discounts and the monthly credit; Street View metadata requests are free
+PRICE_PER_1000 = {"geocode": 5.00, "static": 7.00}
+ROW_LATENCY = 1.5  # Typical seconds per uncached row, for sizing rows in flight
+
+
+def plan_rows(rows_with_indices, flush_rows=FLUSH_ROWS, sheet_writes=True, asset_listing=True):
+    """Predict the API calls a run over rows_with_indices would make, without making any
+
+    Rows are resolved against the asset index, the geocode cache (read
+    without touching it) and the offline address index only. With
+    asset_listing, the caller has already listed the asset index, which
+    spends Cloudinary Admin API calls; the plan reports them.
+    Addresses that are not cached are assumed to geocode, and every distinct
+    location is assumed to need its own panorama and upload, so Google and
+    Cloudinary counts are upper bounds; identical addresses are counted once,
+    as the run coalesces them.
+    """
+    rows = hosted = cached = cached_misses = 0
+    new_addresses = set()
+    locations = set()
+    for _, row in rows_with_indices:
+        rows += 1
+        if build_public_id(row) in asset_index:
+            hosted += 1
+            continue
+        address = build_address(row)
+        coords = geocode_cache.peek(address) or offline_geocoder.lookup(address)
+        if coords is None:
+            new_addresses.add(normalize_address(address))
+        elif coords[0] is None or coords[1] is None:
+            cached_misses += 1
+        else:
+            cached += 1
+            locations.add((round(coords[0], COORD_PRECISION), round(coords[1], COORD_PRECISION)))
+
+    calls = dict.fromkeys(ENDPOINTS, 0)
+    calls["geocode"] = len(new_addresses)
+    calls["metadata"] = calls["static"] = calls["cloudinary"] = len(locations) + len(new_addresses)
+    if sheet_writes:
+        calls["sheets_write"] = math.ceil(rows / flush_rows)
+    if asset_listing:
+        calls["cloudinary_admin"] = max(1, math.ceil(len(asset_index) / LIST_PAGE_SIZE))
+
+    # Each endpoint's bucket starts full, then refills at its configured rate
+    seconds = {}
+    for endpoint, count in calls.items():
+        qps, burst = limiter.limits[endpoint]
+        seconds[endpoint] = max(0.0, count - burst) / qps if count else 0.0
+    bottleneck = max(seconds, key=seconds.get)
+    wall_time = seconds[bottleneck]
+    working = rows - hosted - cached_misses
+
+    return {
+        "rows": rows,
+        "asset_listing": asset_listing,
+        "hosted": hosted,
+        "geocode_cached": cached,
+        "cached_misses": cached_misses,
+        "calls": calls,
+        "seconds": seconds,
+        "bottleneck": bottleneck,
+        "wall_time": wall_time,
+        "cost": sum(calls[endpoint] * price / 1000 for endpoint, price in PRICE_PER_1000.items()),
+        # Little's law: rows in flight = row throughput x seconds per row
+        "rows_in_flight": math.ceil(working / wall_time * ROW_LATENCY) if wall_time else None,
+    }
+
+
+def format_plan(plan):
+    lines = [
+        "=" * 60,
+        "RUN PLAN (no Google or upload calls were made)",
+        "=" * 60,
+        f"Rows to process: {plan['rows']}",
+        f"  Already on Cloudinary: {plan['hosted']}",
+        f"  Geocode cached or in the offline index: {plan['geocode_cached']}",
+        f"  Cached as ungeocodable (will fail): {plan['cached_misses']}",
+        "",
+        "Expected calls (upper bounds) and time at the configured rate limits:",
+    ]
+    for endpoint, count in plan["calls"].items():
+        if count:
+            qps, _ = limiter.limits[endpoint]
+            lines.append(f"  {endpoint:<17} {count:>9}  {plan['seconds'][endpoint] / 60:8.1f} min at {qps:g}/s")
+    if UPLOAD_MODE == "fetch":
+        lines.append("  (fetch mode: Cloudinary makes the static fetches)")
+    lines.append("")
+    lines.append(f"Projected wall time: {plan['wall_time'] / 60:.1f} min, limited by {plan['bottleneck']}")
+    lines.append(f"Estimated Google cost: ${plan['cost']:.2f} at list prices")
+    if plan["asset_listing"]:
+        lines.append(f"Listing existing images for this plan used about {plan['calls']['cloudinary_admin']} "
+                     "Cloudinary Admin API calls (--no-asset-index skips it)")
+    if plan["rows_in_flight"]:
+        lines.append(f"Rows in flight to sustain that pace: about {plan['rows_in_flight']} "
+                     f"at {ROW_LATENCY:g}s per row")
+    return "\n".join(lines)
@@ -0,0 +1,128 @@
+import mmap
+import os
+import struct
+import threading
+import time
+
+from .metrics import metrics
+from .tracing import tracer
+
+# Endpoint slots in the shared state file. Append only: the index of each
+# name is its position in the file, so reordering breaks running processes.
+ENDPOINTS = ("geocode", "metadata", "static", "cloudinary", "sheets_write", "cloudinary_admin", "sheets_read")
+
+# Default (requests per second, burst) per endpoint
+DEFAULT_LIMITS = {
+    "geocode": (50, 10),     # Geocoding API: 3,000 QPM
+    "metadata": (50, 10),    # Street View metadata
+    "static": (50, 10),      # Street View Static API image fetches
+    "cloudinary": (20, 5),   # Cloudinary uploads
+    "sheets_write": (1, 3),  # Sheets API: 60 write requests per minute per user
+    "cloudinary_admin": (0.13, 500),  # Cloudinary Admin API: 500 calls per hour
+    "sheets_read": (1, 5),   # Sheets API: 60 read requests per minute per user
+}
+
+# File shared by every batch process on this host; set RATE_LIMIT_STATE=""
+# to keep buckets process-local
+SHARED_STATE_PATH = os.environ.get("RATE_LIMIT_STATE", "ratelimit.state")
+
+_SLOT = struct.Struct("dd")  # tokens, last refill (wall clock)
+
+try:
+    import fcntl
+
+    def _lock_file(fd):
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+    def _unlock_file(fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+except ImportError:  # Windows
+    import msvcrt
+
+    def _lock_file(fd):
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+
+    def _unlock_file(fd):
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+def _limits_from_env(endpoint):
+    qps, burst = DEFAULT_LIMITS[endpoint]
+    prefix = f"RATE_LIMIT_{endpoint.upper()}"
+    qps = float(os.environ.get(f"{prefix}_QPS", qps))
+    burst = float(os.environ.get(f"{prefix}_BURST", burst))
+    return qps, burst
+
+
+class RateLimiter:
+    """Per-endpoint token buckets, optionally shared across processes
+
+    Callers reserve a token and sleep for the returned delay outside the
+    lock. The bucket may go negative, which queues reservations in order
+    instead of letting every waiter wake and retry at the same moment.
+    """
+
+    def __init__(self, state_path=SHARED_STATE_PATH, limits=None):
+        self.limits = {name: _limits_from_env(name) for name in ENDPOINTS}
+        if limits:
+            self.limits.update(limits)
+        self.state_path = state_path
+        self._lock = threading.Lock()
+        self._local = {}
+        self._fd = None
+        self._map = None
+
+    def _open_shared(self):
+        if self._map is None:
+            fd = os.open(self.state_path, os.O_RDWR | os.O_CREAT, 0o644)
+            size = _SLOT.size * len(ENDPOINTS)
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._fd = fd
+            self._map = mmap.mmap(fd, size)
+        return self._map
+
+    def _take(self, tokens, updated, qps, burst, now):
+        tokens = min(burst, tokens + max(0.0, now - updated) * qps) - 1
+        delay = -tokens / qps if tokens < 0 else 0.0
+        return tokens, delay
+
+    def reserve(self, endpoint):
+        """Reserve one call on endpoint and return how long to wait before making it"""
+        qps, burst = self.limits[endpoint]
+        if qps <= 0:
+            return 0.0
+
+        with self._lock:
+            now = time.time()
+            if not self.state_path:
+                tokens, updated = self._local.get(endpoint, (burst, now))
+                tokens, delay = self._take(tokens, updated, qps, burst, now)
+                self._local[endpoint] = (tokens, now)
+                return delay
+
+            shared = self._open_shared()
+            offset = ENDPOINTS.index(endpoint) * _SLOT.size
+            _lock_file(self._fd)
+            try:
+                tokens, updated = _SLOT.unpack_from(shared, offset)
+                tokens, delay = self._take(tokens, updated, qps, burst, now)
+                _SLOT.pack_into(shared, offset, tokens, now)
+            finally:
+                _unlock_file(self._fd)
+            return delay
+
+    def acquire(self, endpoint):
+        """Block until a call on endpoint is allowed; returns the time slept"""
+        delay = self.reserve(endpoint)
+        if delay > 0:
+            metrics.inc("rate_limit_wait_seconds_total", delay, endpoint=endpoint)
+            with tracer.span("rate_limit_wait", cat="wait", endpoint=endpoint):
+                time.sleep(delay)
+        return delay
+
+
+# Limiter shared by every module in this process
+limiter = RateLimiter()
@@ -0,0 +1,250 @@
+import random
+import threading
+import time
+
+from .errors import PipelineError, RateLimitError, TransientError
+from .deadline import deadline
+from .metrics import metrics
+from .tracing import tracer
+
+# Retries allowed across every endpoint: each call earns RETRY_BUDGET_RATIO
+# retries, on top of RETRY_BUDGET_MIN to start with, up to RETRY_BUDGET_MAX.
+# When a dependency fails for every request, retries stay a small share of
+# the traffic instead of multiplying it.
+RETRY_BUDGET_RATIO = 0.2
+RETRY_BUDGET_MIN = 20
+RETRY_BUDGET_MAX = 200
+
+BREAKER_FAILURES = 5  # Consecutive transient failures that open an endpoint's breaker
+BREAKER_COOLDOWN = 10  # Seconds an open breaker pauses calls; doubled after each failed probe...
+BREAKER_MAX_COOLDOWN = 120  # ...up to this long
+PAUSE_POLL = 1.0  # Longest single sleep while paused, so a closing breaker or the deadline is noticed
+
+
+class RetryPolicy:
+    """How often and how patiently to retry one endpoint
+
+    Waits grow exponentially from base_delay and are drawn uniformly from
+    [0, backoff] ("full jitter"), so workers that failed together do not
+    retry together.
+    """
+
+    def __init__(self, attempts, base_delay, max_delay):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+# Every endpoint called through call()/call_async() needs a policy here
+RETRY_POLICIES = {
+    "geocode": RetryPolicy(attempts=4, base_delay=0.5, max_delay=8),
+    "metadata": RetryPolicy(attempts=4, base_delay=0.5, max_delay=8),
+    "static": RetryPolicy(attempts=3, base_delay=0.5, max_delay=5),
+    "cloudinary": RetryPolicy(attempts=4, base_delay=1, max_delay=20),
+    # The read quota is per minute, so waits are long enough for it to refill
+    "sheets_read": RetryPolicy(attempts=5, base_delay=2, max_delay=30),
+}
+
+
+class RetryBudget:
+    """Token bucket of retries shared by every endpoint and worker"""
+
+    def __init__(self, ratio=RETRY_BUDGET_RATIO, initial=RETRY_BUDGET_MIN, cap=RETRY_BUDGET_MAX):
+        self.ratio = ratio
+        self.cap = cap
+        self._tokens = float(initial)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.cap, self._tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    """Pauses calls to an endpoint after repeated transient failures
+
+    Closed, calls go straight through. After BREAKER_FAILURES failures in a
+    row it opens and every caller waits out the cooldown instead of
+    calling. One caller then probes: success closes the breaker, failure
+    reopens it with a doubled cooldown. Permanent errors mean the API
+    answered, so they count as successes.
+    """
+
+    def __init__(self, endpoint, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN,
+                 max_cooldown=BREAKER_MAX_COOLDOWN):
+        self.endpoint = endpoint
+        self.threshold = failures
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Seconds to wait before calling; 0 means call now"""
+        with self._lock:
+            if self.state == "closed":
+                return 0
+            if self.state == "open":
+                remaining = self._opened_at + self.cooldown - time.monotonic()
+                if remaining > 0:
+                    return remaining
+                self.state = "half-open"
+            if self._probing:
+                return PAUSE_POLL
+            self._probing = True
+            return 0
+
+    def success(self):
+        with self._lock:
+            if self.state != "closed":
+                print(f"  {self.endpoint} is answering again; resuming calls")
+            self.state = "closed"
+            self._failures = 0
+            self._probing = False
+            self.cooldown = self.base_cooldown
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half-open" and self._probing:
+                self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+            elif self.state != "closed" or self._failures < self.threshold:
+                return
+            self.state = "open"
+            self._opened_at = time.monotonic()
+            self._probing = False
+        metrics.inc("breaker_opened_total", endpoint=self.endpoint)
+        print(f"  {self.endpoint} keeps failing; pausing its calls for {self.cooldown:.0f}s")
+
+    def abandon(self):
+        """The call ended without an answer either way (cancelled, unexpected error)"""
+        with self._lock:
+            self._probing = False
+
+
+def add_overload_listener(callback):
+    """Call callback() whenever an endpoint reports it is out of quota"""
+    _overload_listeners.append(callback)
+
+
+def _pause_for(breaker):
+    """Seconds to sleep before the next reserve(), or raise once the run is draining
+
+    A row in flight during the drain would otherwise wait out one cooldown
+    per probe while the endpoint stays down, and without a runtime limit
+    nothing else would end that wait.
+    """
+    delay = breaker.reserve()
+    if delay > 0 and not deadline.admitting():
+        raise TransientError(f"{breaker.endpoint} unavailable (circuit open)", breaker.endpoint)
+    return min(delay, PAUSE_POLL)
+
+
+def _retry_delay(endpoint, policy, breaker, error, attempt):
+    """Record a failed call with the breaker; seconds to wait before retrying, or None to give up"""
+    if error.endpoint not in (None, endpoint):
+        # A nested call to another endpoint already ran its own retries
+        breaker.abandon()
+        return None
+    if not error.retryable:
+        breaker.success()
+        return None
+    breaker.failure()
+    if isinstance(error, RateLimitError):
+        for callback in _overload_listeners:
+            callback()
+    if attempt + 1 >= policy.attempts:
+        return None
+    # While draining, rows in flight finish with what they have
+    if not deadline.admitting():
+        return None
+    if not retry_budget.withdraw():
+        metrics.inc("retry_budget_exhausted_total", endpoint=endpoint)
+        return None
+    metrics.inc("retries_total", endpoint=endpoint)
+    return policy.backoff(attempt)
+
+
+def call(endpoint, fn):
+    """Run fn() under the endpoint's circuit breaker and retry policy
+
+    Only PipelineErrors are retried; fn() should raise the errors.py type
+    that fits each failure.
+    """
+    policy = RETRY_POLICIES[endpoint]
+    breaker = breakers[endpoint]
+    retry_budget.deposit()
+    for attempt in range(policy.attempts):
+        delay = _pause_for(breaker)
+        if delay > 0:
+            with tracer.span("breaker_wait", cat="wait", endpoint=endpoint):
+                while delay > 0:
+                    metrics.inc("breaker_wait_seconds_total", delay, endpoint=endpoint)
+                    time.sleep(delay)
+                    delay = _pause_for(breaker)
+        try:
+            result = fn()
+        except PipelineError as e:
+            delay = _retry_delay(endpoint, policy, breaker, e, attempt)
+            if delay is None:
+                raise
+            with tracer.span("retry_wait", cat="wait", endpoint=endpoint):
+                time.sleep(delay)
+        except BaseException:
+            breaker.abandon()
+            raise
+        else:
+            breaker.success()
+            return result
+
+
+async def call_async(endpoint, fn):
+    """call() for the async engine: fn() returns an awaitable, and waits do not block the loop"""
+    import asyncio
+
+    policy = RETRY_POLICIES[endpoint]
+    breaker = breakers[endpoint]
+    retry_budget.deposit()
+    for attempt in range(policy.attempts):
+        delay = _pause_for(breaker)
+        if delay > 0:
+            with tracer.span("breaker_wait", cat="wait", endpoint=endpoint):
+                while delay > 0:
+                    metrics.inc("breaker_wait_seconds_total", delay, endpoint=endpoint)
+                    await asyncio.sleep(delay)
+                    delay = _pause_for(breaker)
+        try:
+            result = await fn()
+        except PipelineError as e:
+            delay = _retry_delay(endpoint, policy, breaker, e, attempt)
+            if delay is None:
+                raise
+            with tracer.span("retry_wait", cat="wait", endpoint=endpoint):
+                await asyncio.sleep(delay)
+        except BaseException:
+            breaker.abandon()
+            raise
+        else:
+            breaker.success()
+            return result
+
+
+_overload_listeners = []
+
+# Process-wide: every worker, stage and engine shares one budget and one breaker per endpoint
+retry_budget = RetryBudget()
+breakers = {endpoint: CircuitBreaker(endpoint) for endpoint in RETRY_POLICIES}
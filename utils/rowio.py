@@ -0,0 +1,172 @@
+import csv
+import json
+import os
+import time
+
+from .sheets import PROCESS_COLUMNS, SheetRow, batch_update_rows
+from .variants import VARIANTS, variant_urls
+
+FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".parquet": "parquet"}
+RESULT_COLUMNS = ["row", "image_URL", "Processing Status"]
+SYNC_CHUNK_ROWS = 5000  # Rows per sheet write when syncing results back
+PARQUET_BATCH_ROWS = 10000  # Rows read per Parquet record batch
+# Local writes are cheap, but each Parquet write is a new part file
+FILE_FLUSH_ROWS = 5000
+FILE_FLUSH_INTERVAL = 30
+
+
+def default_output_path(input_path):
+    """results file next to the input: rows.csv -> rows.results.csv"""
+    stem, ext = os.path.splitext(input_path.rstrip("/"))
+    return f"{stem}.results{ext}"
+
+
+def _arrow():
+    """pyarrow and pyarrow.parquet, imported only once a Parquet file is used"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet files need pyarrow: pip install pyarrow") from None
+    return pyarrow, pyarrow.parquet
+
+
+def file_format(path):
+    fmt = FORMATS.get(os.path.splitext(path.rstrip("/"))[1].lower())
+    if fmt is None:
+        raise ValueError(f"Unsupported file type for {path} (expected {', '.join(FORMATS)})")
+    if fmt == "parquet":
+        _arrow()
+    return fmt
+
+
+def _to_row(record):
+    """SheetRow from a dict of column values, or None for blank/finished rows"""
+    values = {}
+    for name in PROCESS_COLUMNS:
+        value = record.get(name)
+        values["status" if name == "Processing Status" else name] = "" if value is None else str(value)
+    if not any(values.values()) or values["image_URL"]:
+        return None
+    return SheetRow(**values)
+
+
+class FileSource:
+    """Streams (row_index, SheetRow) for rows missing image_URL from a CSV, JSONL or Parquet file
+
+    Rows are read lazily, so memory stays flat however large the file is.
+    row_index counts data rows from 0, the same numbering a sheet uses.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.format = file_format(path)
+
+    def _records(self):
+        if self.format == "csv":
+            with open(self.path, newline="", encoding="utf-8") as f:
+                yield from csv.DictReader(f)
+        elif self.format == "jsonl":
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    yield json.loads(line) if line.strip() else {}
+        else:
+            _, pq = _arrow()
+            parquet = pq.ParquetFile(self.path)
+            columns = [name for name in PROCESS_COLUMNS if name in parquet.schema_arrow.names]
+            for batch in parquet.iter_batches(batch_size=PARQUET_BATCH_ROWS, columns=columns):
+                yield from batch.to_pylist()
+
+    def __iter__(self):
+        for index, record in enumerate(self._records()):
+            row = _to_row(record)
+            if row is not None:
+                yield index, row
+
+
+class FileSink:
+    """Appends (index, image_URL, status) results to a CSV, JSONL or Parquet results file
+
+    CSV and JSONL are appended and flushed on every write. Parquet files
+    cannot be appended to, so a Parquet sink is a directory that gets one
+    part file per write, each renamed into place once complete.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.destination = path
+        self.format = file_format(path)
+        self.columns = RESULT_COLUMNS + list(VARIANTS)
+        self._file = None
+        self._csv = None
+        self._parts = 0
+        if self.format == "parquet":
+            os.makedirs(path, exist_ok=True)
+
+    def _records(self, updates):
+        for index, image_url, status in updates:
+            record = {"row": index, "image_URL": image_url, "Processing Status": status}
+            record.update(variant_urls(image_url))
+            yield record
+
+    def write(self, updates):
+        if self.format == "parquet":
+            self._parts += 1
+            part = os.path.join(self.path, f"part-{int(time.time())}-{os.getpid()}-{self._parts:05d}.parquet")
+            pa, pq = _arrow()
+            table = pa.Table.from_pylist(list(self._records(updates)))
+            pq.write_table(table, part + ".tmp")
+            os.replace(part + ".tmp", part)
+            return
+
+        if self._file is None:
+            new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            self._file = open(self.path, "a", newline="", encoding="utf-8")
+            if self.format == "csv":
+                self._csv = csv.DictWriter(self._file, fieldnames=self.columns)
+                if new_file:
+                    self._csv.writeheader()
+        for record in self._records(updates):
+            if self._csv is not None:
+                self._csv.writerow(record)
+            else:
+                self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_results(path):
+    """Yield (index, image_URL, status) from a results file written by FileSink"""
+    fmt = file_format(path)
+    if fmt == "csv":
+        with open(path, newline="", encoding="utf-8") as f:
+            for record in csv.DictReader(f):
+                yield int(record["row"]), record["image_URL"], record["Processing Status"]
+    elif fmt == "jsonl":
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record["row"], record["image_URL"], record["Processing Status"]
+    else:
+        _, pq = _arrow()
+        for name in sorted(os.listdir(path)):
+            if name.endswith(".parquet"):
+                for record in pq.read_table(os.path.join(path, name), columns=RESULT_COLUMNS).to_pylist():
+                    yield record["row"], record["image_URL"], record["Processing Status"]
+
+
+def sync_results_to_sheet(path, sheet, chunk_rows=SYNC_CHUNK_ROWS):
+    """Write a results file back into the sheet; the latest result per row wins"""
+    latest = {}
+    for index, image_url, status in read_results(path):
+        latest[index] = (index, image_url, status)
+    updates = [latest[index] for index in sorted(latest)]
+    for start in range(0, len(updates), chunk_rows):
+        batch_update_rows(sheet, updates[start:start + chunk_rows])
+        print(f"  Synced {min(start + chunk_rows, len(updates))}/{len(updates)} rows to Google Sheets")
+    return len(updates)
@@ -1,5 +1,13 @@
-from google.oauth2.service_account import Credentials
-import gspread
+import datetime
+import json
+import os
+import time
+
+from .ratelimit import limiter
+from .metrics import metrics
+from .variants import VARIANTS, variant_urls
+from .errors import PipelineError, RateLimitError, TransientError, error_for_status
+from .retry import call
 
 # Define the sheet you're connecting to
 SHEET_ID = "1wavqnMBfFsDLAuxC4DS6heorIyuZcyKJwCWxn0mIdbA"
@@ -11,39 +19,348 @@ SCOPES = [
     "https://www.googleapis.com/auth/drive"
 ]
 
-# Authenticate with service account
-def get_sheet():
+# Set to a bench/emulator.py server URL to run against a local fake sheet
+SHEETS_EMULATOR_URL = os.environ.get("SHEETS_EMULATOR_URL")
+
+# gspread and google-auth are imported on first use, so file-only runs and
+# --help never load them
+
+# Access token and worksheet properties kept between runs, so a short run
+# from cron starts without the token exchange and two metadata reads.
+# The file holds a live bearer token; set SHEETS_AUTH_CACHE="" to disable.
+AUTH_CACHE_PATH = os.environ.get("SHEETS_AUTH_CACHE", ".sheets_auth_cache.json")
+TOKEN_MARGIN = 300  # Refresh tokens this many seconds before they expire
+WORKSHEET_CACHE_TTL = 600  # Re-read the worksheet's properties (row count etc.) after this long
+
+_sheet = None  # Worksheet handle shared by every caller in this process
+
+
+def _load_auth_cache():
+    if not AUTH_CACHE_PATH:
+        return {}
+    try:
+        with open(AUTH_CACHE_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_auth_cache(cache):
+    if not AUTH_CACHE_PATH:
+        return
+    tmp = AUTH_CACHE_PATH + ".tmp"
+    try:
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(cache, f)
+        os.replace(tmp, AUTH_CACHE_PATH)
+    except OSError as e:
+        print(f"  Could not save the Sheets auth cache: {e}")
+
+
+def _open_sheet():
+    from google.oauth2.service_account import Credentials
+    import google.auth.transport.requests
+    import gspread
+
+    cache = _load_auth_cache()
+    now = time.time()
+
     creds = Credentials.from_service_account_file("credentials.json", scopes=SCOPES)
+    if cache.get("expiry", 0) - TOKEN_MARGIN > now:
+        creds.token = cache["token"]
+        # google-auth compares expiry against naive UTC datetimes
+        creds.expiry = datetime.datetime.fromtimestamp(cache["expiry"], datetime.timezone.utc).replace(tzinfo=None)
+    else:
+        creds.refresh(google.auth.transport.requests.Request())
+        expiry = creds.expiry.replace(tzinfo=datetime.timezone.utc).timestamp()
+        cache.update(token=creds.token, expiry=expiry)
     client = gspread.authorize(creds)
-    sheet = client.open_by_key(SHEET_ID).worksheet(SHEET_NAME)
+
+    sheet = None
+    if cache.get("sheet") == [SHEET_ID, SHEET_NAME] and now - cache.get("worksheet_saved", 0) < WORKSHEET_CACHE_TTL:
+        try:
+            sheet = gspread.Worksheet(None, cache["worksheet"], SHEET_ID, client.http_client)
+        except (TypeError, RuntimeError):  # gspread < 6 needs the spreadsheet object
+            sheet = None
+    if sheet is None:
+        sheet = client.open_by_key(SHEET_ID).worksheet(SHEET_NAME)
+        cache.update(sheet=[SHEET_ID, SHEET_NAME], worksheet=sheet._properties, worksheet_saved=now)
+    _save_auth_cache(cache)
     return sheet
 
+
+class EmulatedWorksheet:
+    """The subset of gspread.Worksheet the pipeline uses, backed by a bench/emulator.py server"""
+
+    id = 0
+
+    def __init__(self, url):
+        import requests
+
+        self.url = url.rstrip("/")
+        self.session = requests.Session()
+        info = self._request("GET", "/sheets/header")
+        self._header = info["header"]
+        self.row_count = info["row_count"]
+
+    def _request(self, method, path, payload=None):
+        res = self.session.request(method, self.url + path, json=payload, timeout=60)
+        if res.status_code != 200:
+            raise error_for_status(res.status_code, f"Sheets emulator returned {res.status_code}: {res.text}", None)
+        return res.json()
+
+    def row_values(self, row):
+        if row == 1:
+            return list(self._header)
+        return self.batch_get([f"A{row}:{chr(64 + len(self._header))}{row}"])[0][0]
+
+    def batch_get(self, ranges):
+        return self._request("POST", "/sheets/values:batchGet", {"ranges": ranges})["valueRanges"]
+
+    def batch_update(self, data):
+        return self._request("POST", "/sheets/values:batchUpdate", {"data": data})
+
+
+# Authenticate with service account
+def get_sheet():
+    global _sheet
+    if SHEETS_EMULATOR_URL:
+        return EmulatedWorksheet(SHEETS_EMULATOR_URL)
+    if _sheet is None:
+        _sheet = _open_sheet()
+    return _sheet
+
+# Columns the pipeline reads; everything else in the sheet is never fetched
+PROCESS_COLUMNS = ("address", "city", "state", "zip_code", "image_URL", "Processing Status")
+PAGE_SIZE = 1000  # Rows per read request
+
+class SheetRow:
+    """Compact record holding only the projected columns of one sheet row"""
+    __slots__ = ("address", "city", "state", "zip_code", "image_URL", "status")
+
+    def __init__(self, address="", city="", state="", zip_code="", image_URL="", status=""):
+        self.address = address
+        self.city = city
+        self.state = state
+        self.zip_code = zip_code
+        self.image_URL = image_URL
+        self.status = status
+
+    # Dict-style access so rows work wherever get_all_records() dicts did
+    def __getitem__(self, key):
+        return getattr(self, "status" if key == "Processing Status" else key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except AttributeError:
+            return default
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"SheetRow({fields})"
+
+def _read_error(error):
+    """errors.py type for a failed Sheets read, or None when retrying cannot help"""
+    if isinstance(error, PipelineError):
+        return error
+    status = getattr(getattr(error, "response", None), "status_code", None)  # gspread.exceptions.APIError
+    if status is not None:
+        return error_for_status(status, f"Sheets read failed: {error}", "sheets_read")
+    if isinstance(error, OSError):  # requests' connection errors and timeouts
+        return TransientError(f"Sheets read failed: {error}", "sheets_read")
+    return None
+
+def sheets_read(read):
+    """Run read() within the Sheets read quota, retrying quota errors, timeouts and 5xx responses"""
+    def attempt():
+        limiter.acquire("sheets_read")
+        with metrics.timed("sheets_read"):
+            try:
+                return read()
+            except Exception as e:
+                error = _read_error(e)
+                if error is None:
+                    raise
+                if isinstance(error, RateLimitError):
+                    # The read quota is not the rows-in-flight limit, so the controller is not told
+                    error = TransientError(str(error), "sheets_read")
+                raise error from e
+
+    return call("sheets_read", attempt)
+
+def read_ranges(sheet, ranges):
+    """sheet.batch_get(ranges) through sheets_read()"""
+    return sheets_read(lambda: sheet.batch_get(ranges))
+
+def get_column_layout(sheet, columns=PROCESS_COLUMNS):
+    """Map each wanted header name to its 1-based column number"""
+    header = sheets_read(lambda: sheet.row_values(1))
+    return {name: header.index(name) + 1 for name in columns if name in header}
+
+def _projected_columns(sheet, layout):
+    """Column letters and SheetRow field names for the PROCESS_COLUMNS in layout"""
+    import gspread
+
+    missing = [name for name in ("address", "city", "state", "zip_code") if name not in layout]
+    if missing:
+        raise ValueError(f"Sheet is missing required columns: {', '.join(missing)}")
+
+    names = list(layout)
+    letters = [gspread.utils.rowcol_to_a1(1, layout[name])[:-1] for name in names]
+    fields = ["status" if name == "Processing Status" else name for name in names]
+    return letters, fields
+
+def _pending_rows(fields, columns, start, count):
+    """(row_index, SheetRow) for rows missing image_URL in columns read from sheet row start"""
+    for offset in range(count):
+        values = {}
+        for field, column in zip(fields, columns):
+            cell = column[offset] if offset < len(column) and column[offset] else [""]
+            values[field] = cell[0]
+        if not any(values.values()) or values.get("image_URL"):
+            continue
+        yield start + offset - 2, SheetRow(**values)
+
+def iter_rows_to_process(sheet, page_size=PAGE_SIZE, start_row=2):
+    """Lazily yield (row_index, SheetRow) for rows missing image_URL
+
+    Reads only PROCESS_COLUMNS, one page of rows per request, and stops at
+    the first page with no data, so work can start after the first page.
+    The worksheet's row_count may come from the auth cache and miss rows
+    appended since, so the last page is open-ended (A9001:A) and runs to
+    the end of the data.
+    """
+    letters, fields = _projected_columns(sheet, get_column_layout(sheet))
+
+    start = start_row
+    while start + page_size <= sheet.row_count:
+        end = start + page_size - 1
+        columns = read_ranges(sheet, [f"{letter}{start}:{letter}{end}" for letter in letters])
+        if not any(columns):
+            return
+        yield from _pending_rows(fields, columns, start, page_size)
+        start += page_size
+    columns = read_ranges(sheet, [f"{letter}{start}:{letter}" for letter in letters])
+    yield from _pending_rows(fields, columns, start, max((len(column) for column in columns), default=0))
+
+def read_rows_from(sheet, start_row):
+    """Pending rows from start_row to the end of the data, and the first row past the data
+
+    Open-ended ranges (A120:A) are clipped to the data by the API, so when
+    nothing was appended this is one small read, and rows added after the
+    grid grew are still found. Uses the cached header layout.
+    """
+    letters, fields = _projected_columns(sheet, get_cached_column_layout(sheet))
+    columns = read_ranges(sheet, [f"{letter}{start_row}:{letter}" for letter in letters])
+    count = max((len(column) for column in columns), default=0)
+    return list(_pending_rows(fields, columns, start_row, count)), start_row + count
+
 # Fetch records to process (rows missing image_URL) with row indices
 def get_rows_to_process(sheet):
-    data = sheet.get_all_records()
-    rows_with_indices = [(i, row) for i, row in enumerate(data) if not row.get("image_URL")]
-    return rows_with_indices
+    return list(iter_rows_to_process(sheet))
+
+# Header layouts keyed by worksheet id, so writes never search the sheet
+_layout_cache = {}
+
+def get_cached_column_layout(sheet, columns=PROCESS_COLUMNS):
+    key = (sheet.id, columns)
+    layout = _layout_cache.get(key)
+    if layout is None:
+        layout = get_column_layout(sheet, columns)
+        _layout_cache[key] = layout
+    return layout
+
+def contiguous_runs(row_indices):
+    """Sorted row indices grouped into runs of consecutive rows, one list per run"""
+    runs = []
+    for row_index in sorted(row_indices):
+        if runs and row_index == runs[-1][-1] + 1:
+            runs[-1].append(row_index)
+        else:
+            runs.append([row_index])
+    return runs
+
+def build_update_ranges(updates, image_url_col, status_col):
+    """Coalesce (row_index, image_url, status) updates into as few ranges as possible
+
+    Contiguous rows become one multi-row range. When the two columns are
+    adjacent, each run of rows is written as a single two-column block.
+    """
+    # Later updates for the same row win
+    latest = {}
+    for row_index, image_url, status in updates:
+        latest[row_index] = (image_url, status)
+
+    runs = contiguous_runs(latest)
+
+    adjacent = abs(image_url_col - status_col) == 1
+    from gspread.utils import rowcol_to_a1 as to_a1
+    batch_data = []
+    for run in runs:
+        first, last = run[0] + 2, run[-1] + 2  # +2 for 0-indexing and header
+        if adjacent:
+            left = min(image_url_col, status_col)
+            values = [
+                list(latest[i]) if image_url_col < status_col else list(reversed(latest[i]))
+                for i in run
+            ]
+            batch_data.append({"range": f"{to_a1(first, left)}:{to_a1(last, left + 1)}", "values": values})
+        else:
+            batch_data.extend([
+                {"range": f"{to_a1(first, image_url_col)}:{to_a1(last, image_url_col)}",
+                 "values": [[latest[i][0]] for i in run]},
+                {"range": f"{to_a1(first, status_col)}:{to_a1(last, status_col)}",
+                 "values": [[latest[i][1]] for i in run]},
+            ])
+    return batch_data
+
+def build_column_ranges(column, values):
+    """Ranges writing {row_index: value} into one column, one per contiguous run"""
+    runs = contiguous_runs(values)
+    from gspread.utils import rowcol_to_a1 as to_a1
+    return [
+        # +2 for 0-indexing and header
+        {"range": f"{to_a1(run[0] + 2, column)}:{to_a1(run[-1] + 2, column)}", "values": [[values[i]] for i in run]}
+        for run in runs
+    ]
 
 # Batch update multiple rows at once
 def batch_update_rows(sheet, updates):
     if not updates:
         return
     
-    # Get column indices once
-    image_url_col = sheet.find("image_URL").col
-    status_col = sheet.find("Processing Status").col
+    # Column indices come from the cached header layout
+    layout = get_cached_column_layout(sheet)
+    batch_data = build_update_ranges(updates, layout["image_URL"], layout["Processing Status"])
     
-    # Prepare batch update data
-    batch_data = []
-    for row_index, image_url, status in updates:
-        actual_row = row_index + 2  # +2 for 0-indexing and header
-        batch_data.extend([
-            {"range": f"{gspread.utils.rowcol_to_a1(actual_row, image_url_col)}", "values": [[image_url]]},
-            {"range": f"{gspread.utils.rowcol_to_a1(actual_row, status_col)}", "values": [[status]]}
-        ])
+    # Variant URLs derive from the image URL; columns missing from the sheet are skipped
+    if VARIANTS:
+        variant_layout = get_cached_column_layout(sheet, tuple(VARIANTS))
+        urls = {row_index: variant_urls(image_url) for row_index, image_url, _ in updates}
+        for name, column in variant_layout.items():
+            batch_data.extend(build_column_ranges(column, {i: row_urls[name] for i, row_urls in urls.items()}))
     
-    # Execute batch update
-    sheet.batch_update(batch_data)
+    # Execute batch update within the Sheets write quota
+    limiter.acquire("sheets_write")
+    with metrics.timed("sheets_write"):
+        sheet.batch_update(batch_data)
+    metrics.inc("sheet_rows_written_total", len(updates))
+
+class SheetSink:
+    """Writes (row_index, image_url, status) results into a worksheet; the sheet-side twin of rowio.FileSink"""
+
+    destination = "Google Sheets"
+
+    def __init__(self, sheet):
+        self.sheet = sheet
+
+    def write(self, updates):
+        batch_update_rows(self.sheet, updates)
+
+    def close(self):
+        pass
 
 # Legacy function for individual updates (keep for compatibility)
 def update_row(sheet, row_index, image_url, status="✅ Complete"):
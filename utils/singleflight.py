@@ -0,0 +1,43 @@
+import threading
+from concurrent.futures import Future
+
+from .metrics import metrics
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one
+
+    The first caller for a key runs fn(); callers arriving while it is in
+    flight wait on its future and share its result or exception. Nothing is
+    kept once the call finishes, so caching stays with the caller (the
+    geocode cache, PanoIndex) and a failed call can be retried.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            owner = future is None
+            if owner:
+                future = self._calls[key] = Future()
+
+        if not owner:
+            metrics.inc("singleflight_shared_total", group=self.name)
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
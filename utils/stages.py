@@ -0,0 +1,172 @@
+import queue
+import threading
+
+from .gmaps import get_geocode
+from .cloud import upload_to_cloudinary
+from .dedupe import pano_index
+from .assets import asset_index
+from .deadline import deadline
+from .metrics import metrics
+from .tracing import tracer
+from .errors import PermanentError
+from .pipeline import (
+    IMAGE_PARAMS, build_address, build_image_url, build_public_id, pano_heading,
+)
+
+# Worker threads per stage; uploads are the slowest step so they get the most
+STAGE_WORKERS = {
+    "geocode": 8,
+    "metadata": 8,
+    "upload": 16,
+}
+QUEUE_SIZE = 100  # Bounded queues give each stage backpressure
+
+_DONE = object()
+
+
+class RowJob:
+    __slots__ = ("index", "row", "target", "pano")
+
+    def __init__(self, index, row):
+        self.index = index
+        self.row = row
+        self.target = None
+        self.pano = None
+
+
+def geocode_step(job):
+    target_lat, target_lng = get_geocode(build_address(job.row))
+    if not target_lat or not target_lng:
+        raise PermanentError("Geocoding failed")
+    job.target = (target_lat, target_lng)
+
+
+def metadata_step(job):
+    pano_lat, pano_lng, pano_id = pano_index.get_metadata(*job.target)
+    if not pano_id or None in [pano_lat, pano_lng]:
+        raise PermanentError("Street View metadata not available")
+    job.pano = (pano_lat, pano_lng, pano_id)
+
+
+def upload_step(job):
+    pano_lat, pano_lng, pano_id = job.pano
+    target_lat, target_lng = job.target
+    heading = pano_heading(pano_lat, pano_lng, target_lat, target_lng)
+    image_url = build_image_url(pano_id, heading)
+    public_id = build_public_id(job.row)
+    return pano_index.host(
+        (pano_id, heading, IMAGE_PARAMS), public_id,
+        lambda: upload_to_cloudinary(image_url, public_id=public_id),
+    )
+
+
+class Stage:
+    """A pool of worker threads reading jobs from one bounded queue
+
+    Each worker runs step(job) and hands the job to the next stage, or a
+    finished (index, url, status) result to the writer. The last worker to
+    drain passes one end marker per downstream worker. Once the run
+    deadline has passed, jobs are drained from the queue without running.
+    While an endpoint's circuit breaker is open its stage's workers wait,
+    and the full queue holds back the stages in front of it.
+    """
+
+    def __init__(self, name, step, workers, results):
+        self.name = name
+        self.step = step
+        self.workers = workers
+        self.results = results
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.next_stage = None
+        self._finished = 0
+        self._lock = threading.Lock()
+        self._threads = []
+        metrics.register_gauge("queue_depth", self.queue.qsize, stage=name)
+
+    def start(self):
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _run_step(self, job):
+        # API calls retry inside the step; an open circuit breaker pauses this stage's workers
+        with tracer.span(f"{self.name} stage", row=job.index):
+            return self.step(job)
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            if job is _DONE:
+                break
+            if deadline.expired():
+                # Past the deadline, queued rows are left for the next run
+                continue
+            try:
+                hosted_url = self._run_step(job)
+            except Exception as e:
+                print(f"    Error on row {job.index + 1} ({self.name}): {str(e)}")
+                self.results.put((job.index, "", f"Error: {str(e)}"))
+                continue
+            if self.next_stage is None:
+                self.results.put((job.index, hosted_url, "Success"))
+            else:
+                self.next_stage.queue.put(job)
+
+        with self._lock:
+            self._finished += 1
+            last = self._finished == self.workers
+        if last:
+            downstream = self.next_stage.queue if self.next_stage else self.results
+            for _ in range(self.next_stage.workers if self.next_stage else 1):
+                downstream.put(_DONE)
+
+
+def _collect_results(results, on_result):
+    """Drain finished results and pass each to on_result"""
+    while True:
+        result = results.get()
+        if result is _DONE:
+            return
+        on_result(result)
+
+
+def process_rows_staged(rows_with_indices, on_result=None, stage_workers=None):
+    """Run rows through geocode -> metadata -> upload stages
+
+    Each (index, url, status) result is passed to on_result as it finishes
+    and is not kept, so rows_with_indices can be a stream longer than fits
+    in memory. Without on_result, every result is collected and returned.
+    """
+    workers = dict(STAGE_WORKERS, **(stage_workers or {}))
+    results = queue.Queue(maxsize=QUEUE_SIZE)
+    stages = [
+        Stage("geocode", geocode_step, workers["geocode"], results),
+        Stage("metadata", metadata_step, workers["metadata"], results),
+        Stage("upload", upload_step, workers["upload"], results),
+    ]
+    for stage, next_stage in zip(stages, stages[1:]):
+        stage.next_stage = next_stage
+    for stage in stages:
+        stage.start()
+
+    collected = []
+    collector = threading.Thread(target=_collect_results, args=(results, on_result or collected.append),
+                                 name="collector", daemon=True)
+    collector.start()
+
+    # Feeding blocks once the geocode queue is full
+    first = stages[0]
+    for index, row in rows_with_indices:
+        print(f"  Processing: {build_address(row)}")
+        # Already uploaded by an earlier run: no stage work at all
+        hosted_url = asset_index.get(build_public_id(row))
+        if hosted_url:
+            results.put((index, hosted_url, "Success"))
+            continue
+        first.queue.put(RowJob(index, row))
+    for _ in range(first.workers):
+        first.queue.put(_DONE)
+
+    collector.join()
+    return None if on_result else collected
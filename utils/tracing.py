@@ -0,0 +1,144 @@
+import contextlib
+import heapq
+import json
+import os
+import sys
+import threading
+import time
+
+FLUSH_EVENTS = 5000  # Buffered events written to the trace file at a time
+TASK_LANE_BASE = 1 << 48  # Track ids for asyncio task lanes, clear of thread idents
+
+_NO_SPAN = contextlib.nullcontext()
+
+
+def _current_task():
+    # Only the async engine imports asyncio; skip the lookup everywhere else
+    asyncio = sys.modules.get("asyncio")
+    if asyncio is None:
+        return None
+    try:
+        return asyncio.current_task()
+    except RuntimeError:
+        return None
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "cat", "args", "start")
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer.record(self.name, self.start, time.perf_counter(), self.cat, **self.args)
+
+
+class Tracer:
+    """Opt-in per-thread timeline of row steps, API calls and waits
+
+    Spans are written as Chrome trace events (JSON array format), so a run
+    opens in chrome://tracing or https://ui.perfetto.dev with one track per
+    worker thread. Async engine tasks share lanes that are reused once a
+    task is done, so there are only as many lanes as tasks in flight.
+    Disabled, span() is a shared no-op context manager; enabled, each span
+    costs two clock reads and a list append, and events are streamed to
+    disk in batches.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self._events = []
+        self._lanes = set()
+        self._task_lanes = {}
+        self._free_lanes = []
+        self._lock = threading.Lock()
+        self._file = None
+        self._first = True
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+
+    def start(self, path):
+        self.path = path
+        self._file = open(path, "w", encoding="utf-8")
+        self._file.write("[\n")
+        self._first = True
+        self._origin = time.perf_counter()
+        self.enabled = True
+        print(f"Tracing to {path}")
+
+    def span(self, name, cat="step", **args):
+        if not self.enabled:
+            return _NO_SPAN
+        return _Span(self, name, cat, args)
+
+    def record(self, name, start, end, cat="step", **args):
+        """Add a completed span from perf_counter() start/end times"""
+        if not self.enabled:
+            return
+        task = _current_task()
+        event = {"name": name, "cat": cat, "ph": "X", "pid": self._pid,
+                 "ts": round((start - self._origin) * 1e6, 1), "dur": round((end - start) * 1e6, 1)}
+        if args:
+            event["args"] = args
+        with self._lock:
+            if task is None:
+                thread = threading.current_thread()
+                tid, lane_name = thread.ident, thread.name
+            else:
+                tid = self._task_lane(task)
+                lane_name = f"async lane {tid - TASK_LANE_BASE}"
+            if tid not in self._lanes:
+                self._lanes.add(tid)
+                self._events.append({"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid,
+                                     "args": {"name": lane_name}})
+            event["tid"] = tid
+            self._events.append(event)
+            if len(self._events) >= FLUSH_EVENTS:
+                self._flush()
+
+    def _task_lane(self, task):
+        """Lowest free task lane, held until the task is done; call with the lock held"""
+        tid = self._task_lanes.get(task)
+        if tid is None:
+            tid = heapq.heappop(self._free_lanes) if self._free_lanes else TASK_LANE_BASE + len(self._task_lanes)
+            self._task_lanes[task] = tid
+            task.add_done_callback(self._release_lane)
+        return tid
+
+    def _release_lane(self, task):
+        with self._lock:
+            heapq.heappush(self._free_lanes, self._task_lanes.pop(task))
+
+    def _flush(self):
+        if self._file is None or not self._events:
+            return
+        lines = ",\n".join(json.dumps(event) for event in self._events)
+        self._file.write(lines if self._first else ",\n" + lines)
+        self._first = False
+        self._events = []
+
+    def stop(self):
+        """Write buffered events and close the trace file"""
+        if not self.enabled:
+            return
+        self.enabled = False
+        with self._lock:
+            self._flush()
+            self._file.write("\n]\n")
+            self._file.close()
+            self._file = None
+        print(f"Trace written to {self.path} (open in https://ui.perfetto.dev)")
+
+
+# Process-wide tracer; off unless a batch script is run with --trace
+tracer = Tracer()
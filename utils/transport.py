@@ -0,0 +1,54 @@
+import os
+import requests
+from requests.adapters import HTTPAdapter
+
+# Keep-alive connections kept per host. The requests default of 10 is below
+# the worker counts (adaptive window up to 64, 16 staged upload workers), so
+# threads past the tenth would open and throw away a connection on every call.
+POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 64))
+POOL_HOSTS = 8  # Distinct hosts whose pools are kept open
+
+
+def _adapter(pool_size):
+    return HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=pool_size)
+
+
+def _build_session():
+    session = requests.Session()
+    adapter = _adapter(POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# One session (and so one set of pooled connections) for every module
+session = _build_session()
+
+
+def size_cloudinary_pool(pool_size=POOL_SIZE):
+    """Give the Cloudinary SDK's upload connections the same pool size
+
+    The SDK keeps a module-level urllib3 PoolManager holding one
+    connection per host, so concurrent uploads reconnect (TLS included)
+    on almost every call. That PoolManager (uploader._http) is private,
+    so it is only replaced when the installed SDK (pinned in
+    requirements.txt) still has the expected shape; otherwise the SDK
+    keeps its own pool.
+    """
+    import urllib3
+    import cloudinary
+    import cloudinary.uploader
+    import cloudinary.utils
+
+    current = getattr(cloudinary.uploader, "_http", None)
+    if (not isinstance(current, urllib3.PoolManager) or not hasattr(cloudinary, "CERT_KWARGS")
+            or not hasattr(cloudinary.utils, "get_http_connector")):
+        print(f"  Cloudinary SDK {getattr(cloudinary, 'VERSION', '?')} does not expose its upload pool; "
+              "leaving it at the SDK default")
+        return
+    options = dict(cloudinary.CERT_KWARGS, maxsize=pool_size)
+    pooled = cloudinary.utils.get_http_connector(cloudinary.config(), options)
+    if not isinstance(pooled, urllib3.PoolManager) or pooled.connection_pool_kw.get("maxsize") != pool_size:
+        print("  Cloudinary SDK built an unexpected connection pool; leaving it at the SDK default")
+        return
+    cloudinary.uploader._http = pooled
@@ -0,0 +1,40 @@
+import json
+import os
+
+# Extra sizes/formats of each image, keyed by the sheet column their URL is
+# written to. Cloudinary derives them as eager transformations of the one
+# uploaded frame, so they cost no Street View fetches or extra uploads.
+# Example: IMAGE_VARIANTS='{"thumb_URL": {"width": 200, "height": 150, "crop": "fill",
+#                                         "format": "webp", "quality": 70}}'
+VARIANTS = json.loads(os.environ.get("IMAGE_VARIANTS", "{}"))
+
+
+def eager_transformations(variants=None):
+    """Upload option value asking Cloudinary to generate every variant up front"""
+    variants = VARIANTS if variants is None else variants
+    return [dict(transformation) for transformation in variants.values()]
+
+
+def variant_url(secure_url, transformation):
+    """URL of one derived variant of an uploaded image
+
+    Inserts the transformation after /upload/ in the original delivery URL
+    and swaps the extension when the variant changes format.
+    """
+    if not secure_url or "/upload/" not in secure_url:
+        return secure_url
+    import cloudinary.utils
+
+    options = dict(transformation)
+    image_format = options.pop("format", None)
+    transformation_string, _ = cloudinary.utils.generate_transformation_string(**options)
+    base, path = secure_url.split("/upload/", 1)
+    if image_format:
+        path = path.rsplit(".", 1)[0] + "." + image_format
+    return f"{base}/upload/{transformation_string}/{path}"
+
+
+def variant_urls(secure_url, variants=None):
+    """{column: url} for every configured variant of secure_url"""
+    variants = VARIANTS if variants is None else variants
+    return {column: variant_url(secure_url, transformation) for column, transformation in variants.items()}
@@ -0,0 +1,69 @@
+import os
+import time
+
+from .metrics import metrics
+from .sheets import read_rows_from
+
+POLL_INTERVAL = float(os.environ.get("WATCH_POLL_INTERVAL", 15))  # Seconds between polls when idle
+RESCAN_INTERVAL = float(os.environ.get("WATCH_RESCAN_INTERVAL", 3600))  # Full re-read for in-place edits; 0 never
+
+
+class SheetWatcher:
+    """Finds rows appended to a sheet since the last poll
+
+    The first poll reads the whole sheet. After that, each poll checks the
+    spreadsheet's Drive modifiedTime and, only when it changed, reads the
+    range past the last row seen, so an idle poll is one metadata request.
+    Rows edited in place above that point (an address fixed, an image_URL
+    cleared) are found by a full re-read every rescan_interval seconds.
+    Each row is handed out once per address, so rows that failed are not
+    retried on every rescan; a later run picks them up again. A rescan
+    forgets rows that are no longer pending, so only rows appended since
+    the last rescan and rows that failed are remembered.
+    """
+
+    def __init__(self, sheet, rescan_interval=RESCAN_INTERVAL):
+        self.sheet = sheet
+        self.rescan_interval = rescan_interval
+        self.next_row = 2  # First sheet row past the data seen so far
+        self.revision = None
+        self.last_scan = None
+        self._seen = {}  # row_index -> address handed out for it, for rows still pending
+
+    def _revision(self):
+        """Drive modifiedTime of the spreadsheet, or None when it cannot be read"""
+        client = getattr(self.sheet, "client", None)
+        if client is None or not hasattr(client, "get_file_drive_metadata"):
+            return None
+        try:
+            with metrics.timed("drive_read"):
+                return client.get_file_drive_metadata(self.sheet.spreadsheet_id)["modifiedTime"]
+        except Exception as e:
+            print(f"  Could not read the sheet revision, reading new rows anyway: {e}")
+            return None
+
+    def poll(self):
+        """Pending (row_index, SheetRow) pairs not handed out before; [] when nothing changed"""
+        rescan = self.last_scan is None or (
+            self.rescan_interval and time.monotonic() - self.last_scan >= self.rescan_interval)
+        # Read before the sheet so a change made during the read is seen next poll
+        revision = self._revision()
+        if not rescan and revision is not None and revision == self.revision:
+            return []
+
+        rows, next_row = read_rows_from(self.sheet, 2 if rescan else self.next_row)
+        if rescan:
+            self.last_scan = time.monotonic()
+        self.next_row = next_row
+        self.revision = revision
+
+        new_rows = []
+        # A full read lists every pending row, so rows finished since drop out
+        seen = {} if rescan else self._seen
+        for index, row in rows:
+            address = (row.address, row.city, row.state, row.zip_code)
+            if self._seen.get(index) != address:
+                new_rows.append((index, row))
+            seen[index] = address
+        self._seen = seen
+        return new_rows
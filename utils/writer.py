@@ -0,0 +1,137 @@
+import threading
+import time
+
+from .metrics import metrics
+
+FLUSH_ROWS = 200  # Write once this many results are waiting...
+FLUSH_INTERVAL = 10  # ...or once the oldest has waited this many seconds
+MAX_ROWS_PER_WRITE = 5000
+RETRY_DELAY = 5
+MAX_FAILURES_ON_CLOSE = 3  # Give up on a dead sheet instead of hanging at exit
+MAX_FAILURES_ON_FLUSH = 3  # flush() returns the error after this many failed writes in a row
+
+
+class SheetWriter:
+    """Background writer that coalesces results into batched sheet updates
+
+    Workers submit (index, url, status) results as they finish. A writer
+    thread passes them to sink.write() on size/time thresholds while
+    processing continues. The sink is a sheets.SheetSink, whose writes
+    wait for the Sheets write quota, or a rowio.FileSink that appends to a
+    results file; either names itself in sink.destination. Failed writes
+    stay queued and are retried. With a Journal, results are journaled on
+    submit and marked flushed after each successful write.
+    """
+
+    def __init__(self, sink, flush_rows=FLUSH_ROWS, flush_interval=FLUSH_INTERVAL, journal=None):
+        self.sink = sink
+        self.destination = sink.destination
+        self.journal = journal
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.requests = 0
+        self._pending = []
+        self._oldest = None
+        self._writing = False
+        self._flush_requested = False
+        self._closed = False
+        self._failures = 0
+        self.last_error = None
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="sheet-writer", daemon=True)
+        self._thread.start()
+        metrics.register_gauge("queue_depth", self.pending, stage="sheet_writer")
+
+    def submit(self, result):
+        self.submit_many([result])
+
+    def submit_many(self, results):
+        for result in results:
+            metrics.inc("rows_completed_total", outcome="success" if result[1] else "error")
+        if self.journal is not None:
+            self.journal.record(results)
+        with self._cond:
+            if self._oldest is None:
+                self._oldest = time.time()
+            self._pending.extend(results)
+            if len(self._pending) >= self.flush_rows:
+                self._cond.notify_all()
+
+    def pending(self):
+        with self._cond:
+            return len(self._pending) + (1 if self._writing else 0)
+
+    def flush(self):
+        """Block until everything submitted so far has been written
+
+        Returns None once it is, or the last write error after
+        MAX_FAILURES_ON_FLUSH failed writes in a row. The rows then stay
+        queued, and journaled results are replayed by the next run.
+        """
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            while (self._pending or self._writing) and self._thread.is_alive():
+                if self._failures >= MAX_FAILURES_ON_FLUSH:
+                    return self.last_error
+                self._cond.wait(timeout=1)
+        return None
+
+    def close(self):
+        """Flush remaining results and stop the writer thread"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def _due(self):
+        if not self._pending:
+            return False
+        if self._closed or self._flush_requested or len(self._pending) >= self.flush_rows:
+            return True
+        return time.time() - self._oldest >= self.flush_interval
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._due():
+                    if self._closed:
+                        return
+                    self._flush_requested = False
+                    self._cond.notify_all()
+                    self._cond.wait(timeout=1)
+                batch = self._pending[:MAX_ROWS_PER_WRITE]
+                del self._pending[:MAX_ROWS_PER_WRITE]
+                self._oldest = time.time() if self._pending else None
+                self._writing = True
+
+            try:
+                self.sink.write(batch)
+                if self.journal is not None:
+                    self.journal.mark_flushed(batch)
+                failed = False
+                print(f"  Wrote {len(batch)} rows to {self.destination}")
+            except Exception as e:
+                failed = True
+                self.last_error = e
+                print(f"  Write to {self.destination} failed, retrying in {RETRY_DELAY}s: {e}")
+
+            with self._cond:
+                self._writing = False
+                if failed:
+                    self._failures += 1
+                    self._pending[:0] = batch
+                    self._oldest = self._oldest or time.time()
+                    if self._closed and self._failures >= MAX_FAILURES_ON_CLOSE:
+                        print(f"  Giving up on {len(self._pending)} unwritten rows")
+                        self._pending = []
+                        self._cond.notify_all()
+                        return
+                else:
+                    self._failures = 0
+                    self.written += len(batch)
+                    self.requests += 1
+                self._cond.notify_all()
+            if failed:
+                time.sleep(RETRY_DELAY)